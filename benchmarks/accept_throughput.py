@@ -0,0 +1,107 @@
+# BENCHMARK: accept throughput with stalled clients in the mix
+
+# Starts a headless server, opens N connections that never send their name (slow-loris),
+# then measures how many well-behaved clients per second can connect, send a name and
+# get their "connected" message. Without a concurrent handshake stage the first stalled
+# client would block every later connection.
+#   python benchmarks/accept_throughput.py --stalled 200 --clients 2000
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_server(port: int, extra_args) -> subprocess.Popen:
+    cmd = [sys.executable, os.path.join(ROOT, "quiz_engine.py"), "--port", str(port),
+           "--questions", os.path.join(ROOT, "sample_questions.txt"), "--auto-start", "0"] + extra_args
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # Wait until the port accepts connections
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("Server did not start listening.")
+
+
+async def stalled_client(port: int, hold: asyncio.Event):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    await hold.wait() # Never sends a name
+    writer.close()
+
+
+async def good_client(port: int, name: str) -> bool:
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write((name + "\n").encode())
+        line = await asyncio.wait_for(reader.readline(), 30)
+        writer.close()
+        return line.startswith(b"MSG|")
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+
+async def run(args):
+    hold = asyncio.Event()
+    stalled = [asyncio.create_task(stalled_client(args.port, hold)) for _ in range(args.stalled)]
+    await asyncio.sleep(0.2) # Let the stalled connections reach the server first
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(i: int) -> bool:
+        async with semaphore:
+            return await good_client(args.port, "bench" + str(i))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(limited(i) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    hold.set()
+    await asyncio.gather(*stalled, return_exceptions=True)
+    return sum(results), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accept throughput with stalled handshakes.")
+    parser.add_argument("--stalled", type=int, default=100, help="Connections that never send a name")
+    parser.add_argument("--clients", type=int, default=1000, help="Well-behaved clients to connect")
+    parser.add_argument("--concurrency", type=int, default=50, help="Well-behaved clients connecting at once")
+    parser.add_argument("--handshake-timeout", type=float, default=30.0)
+    parser.add_argument("--max-pending-handshakes", type=int, default=4096)
+    args = parser.parse_args()
+    args.port = free_port()
+
+    proc = start_server(args.port, ["--handshake-timeout", str(args.handshake_timeout),
+                                    "--max-pending-handshakes", str(args.max_pending_handshakes)])
+    try:
+        ok, elapsed = asyncio.run(run(args))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    print(f"stalled clients:   {args.stalled}")
+    print(f"accepted clients:  {ok}/{args.clients}")
+    print(f"elapsed:           {elapsed:.3f} s")
+    print(f"connections/sec:   {ok / elapsed:.0f}")
+
+
+if __name__ == "__main__":
+    main()
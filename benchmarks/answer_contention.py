@@ -0,0 +1,87 @@
+# BENCHMARK: many players answering the same question at once
+
+# For each --players N, starts a headless server with metrics on, lets N bots with no think
+# time join one room and play --questions questions, then reads the server's metrics:
+#   answer wait - how long an answer waited for the event loop after its bytes arrived, the
+#                 contention every answer of a round sees from the others
+#   round       - question broadcast until the last answer was taken and scoring started
+#   scoring     - score_current_question, results and scoreboard for the room
+#   ingest      - answers taken per second of round time
+# plus what the bots saw, question to YOURRESULT. The bots run in this process, so for very
+# large N the round time also includes the bots' own work.
+#   python benchmarks/answer_contention.py --players 100 1000 5000
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_client import BotClient, LoadStats, free_port, start_server
+from histogram import format_us
+from quiz_engine import raise_fd_limit
+
+
+async def play(port: int, players: int, connect_concurrency: int) -> LoadStats:
+    stats = LoadStats()
+    bots = [BotClient("p" + str(i), "", "text", stats, random.Random(i)) for i in range(players)]
+    semaphore = asyncio.Semaphore(connect_concurrency)
+
+    async def run(bot: BotClient):
+        async with semaphore:
+            connected = await bot.connect("127.0.0.1", port, 30)
+        if connected:
+            await bot.play()
+
+    await asyncio.gather(*(run(bot) for bot in bots))
+    return stats
+
+
+def quantiles(snapshot: dict, name: str) -> str:
+    h = snapshot["histograms"].get(name)
+    if not h or not h["count"]:
+        return "-"
+    q = h["quantiles"]
+    return f"p50 {format_us(q['0.5']):>9}  p99 {format_us(q['0.99']):>9}  max {format_us(h['max']):>9}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer ingestion with many simultaneous answerers.")
+    parser.add_argument("--players", type=int, nargs="+", default=[100, 1000, 3000])
+    parser.add_argument("--questions", type=int, default=5, help="Questions per game")
+    parser.add_argument("--connect-concurrency", type=int, default=256)
+    args = parser.parse_args()
+    raise_fd_limit()
+
+    for players in args.players:
+        port, metrics_port = free_port(), free_port()
+        server_args = argparse.Namespace(bots=players, rooms=1, questions=os.path.join(ROOT, "sample_questions.txt"),
+                                         num_questions=args.questions, workers=1, time_limit=None, server_log="")
+        # Top-K scoreboards: full ones grow with N and would dominate the rounds
+        proc = start_server(port, server_args, ["--metrics-port", str(metrics_port), "--scoreboard", "top"])
+        try:
+            stats = asyncio.run(play(port, players, args.connect_concurrency))
+            with urllib.request.urlopen(f"http://127.0.0.1:{metrics_port}/metrics.json", timeout=30) as response:
+                snapshot = json.load(response)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+        rounds = snapshot["histograms"].get("round_duration_us", {})
+        answers = snapshot["counters"].get("answers", 0)
+        ingest = answers / (rounds["sum"] / 1e6) if rounds.get("sum") else 0
+        print(f"{players} players, {answers} answers, {stats.finished} finished, {stats.dropped} dropped")
+        print(f"  answer wait:  {quantiles(snapshot, 'answer_wait_us')}")
+        print(f"  round:        {quantiles(snapshot, 'round_duration_us')}")
+        print(f"  scoring:      {quantiles(snapshot, 'scoring_time_us')}")
+        print(f"  bots q->res:  {stats.round_time.summary(format_us)}")
+        print(f"  ingest:       {ingest:,.0f} answers/s of round time")
+
+
+if __name__ == "__main__":
+    main()
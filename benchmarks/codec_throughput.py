@@ -0,0 +1,83 @@
+# BENCHMARK: text vs binary codec
+
+# Encodes a typical message mix (questions, question references, results, scoreboards,
+# personal ranks, answers) with both codecs, then decodes the whole stream, and reports
+# messages per second and bytes on the wire for each.
+#   python benchmarks/codec_throughput.py --messages 50000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import CODECS
+
+
+def message_mix(count: int) -> list:
+    board = "SCOREBOARD (top 10 of 5000):\n" + "\n".join(f"#{i}) player{i}: {100 - i} points" for i in range(1, 11))
+    question = ("QUESTION", "Which planet is closest to the Sun?", "Venus", "Mercury", "Mars", 3, 10)
+    mix = [
+        question,
+        ("YOURRESULT", "Correct. 'B' is right. +1 point."),
+        ("MYRANK", 42, 17, 5000, "player41", 18, "player43", 17),
+        ("SCORE", board),
+        ("ANSWER", "B"),
+        ("MSG", "player7 connected to server."),
+    ]
+    return [mix[i % len(mix)] for i in range(count)]
+
+
+# Binary QUESTION carries the question id as an extra field, after the first time a QREF
+def for_codec(codec_name: str, messages: list) -> list:
+    if codec_name == "text":
+        return messages
+    converted = []
+    sent = False
+    for msg in messages:
+        if msg[0] == "QUESTION":
+            converted.append(("QREF", 7, msg[5], msg[6]) if sent else msg + (7,))
+            sent = True
+        else:
+            converted.append(msg)
+    return converted
+
+
+def run(codec_name: str, messages: list, repeat: int):
+    codec = CODECS[codec_name]
+    messages = for_codec(codec_name, messages)
+    best_encode = best_decode = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = [codec.encode(*msg) for msg in messages]
+        encode_time = time.perf_counter() - start
+
+        stream = b"".join(encoded)
+        start = time.perf_counter()
+        decoder = codec.decoder(len(stream))
+        decoder.feed(stream)
+        decoded = sum(1 for _ in decoder.messages())
+        decode_time = time.perf_counter() - start
+        assert decoded == len(messages)
+
+        best_encode = encode_time if best_encode is None else min(best_encode, encode_time)
+        best_decode = decode_time if best_decode is None else min(best_decode, decode_time)
+    return len(stream), best_encode, best_decode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode/decode throughput of the wire codecs.")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    messages = message_mix(args.messages)
+    print(f"{'codec':8} {'bytes':>10} {'encode msg/s':>14} {'decode msg/s':>14}")
+    for codec_name in ("text", "binary"):
+        size, encode_time, decode_time = run(codec_name, messages, args.repeat)
+        print(f"{codec_name:8} {size:>10} {len(messages) / encode_time:>14,.0f} {len(messages) / decode_time:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# BENCHMARK: parsing bursts of frames
+
+# Feeds bursts of thousands of newline-terminated messages, chopped into recv-sized chunks,
+# through FrameBuffer and through the old string approach (buffer += chunk, then
+# buffer.split("\n", 1) per line) and reports frames per second for both.
+#   python benchmarks/framing_burst.py --frames 20000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from framing import FrameBuffer, RECV_SIZE
+
+
+def make_burst(frames: int) -> bytes:
+    lines = []
+    for i in range(frames):
+        if i % 3 == 0:
+            lines.append("MSG|player" + str(i) + " connected to server.")
+        elif i % 3 == 1:
+            lines.append("ANSWER|B")
+        else:
+            lines.append("SCORE|SCOREBOARD:\\n#1) alice: 3 points\\n#2) bob: 1 points")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def parse_frame_buffer(parts) -> int:
+    frames = FrameBuffer()
+    count = 0
+    for part in parts:
+        frames.feed(part)
+        for frame in frames.frames():
+            frame.decode()
+            count += 1
+    return count
+
+
+# What client_side.receive_loop used to do
+def parse_string_split(parts) -> int:
+    buffer = ""
+    count = 0
+    for part in parts:
+        buffer += part.decode()
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            count += 1
+    return count
+
+
+def best_of(func, parts, repeat: int):
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func(parts)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame parsing throughput on bursts.")
+    parser.add_argument("--frames", type=int, default=20000, help="Frames per burst")
+    parser.add_argument("--chunk", type=int, default=RECV_SIZE, help="Bytes per simulated recv")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    parts = chunks(make_burst(args.frames), args.chunk)
+    for label, func in (("FrameBuffer", parse_frame_buffer), ("str split", parse_string_split)):
+        count, elapsed = best_of(func, parts, args.repeat)
+        print(f"{label:12} {count} frames in {elapsed * 1000:.2f} ms  ({count / elapsed:,.0f} frames/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# BENCHMARK: ranking a large room after every question
+
+# Simulates rounds where a share of the room answers correctly (one of them first) and
+# compares, per round:
+#   sort      - the old approach: copy the scores dict, sort it, walk it for ranks/ties
+#   increment - Leaderboard updates, then top 10, the rank of every score and the leaders
+#   --render also times producing the full scoreboard text from Leaderboard.ranked()
+#   python benchmarks/leaderboard_ranking.py --players 10000 20000 50000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard import Leaderboard
+
+
+def sort_round(scores: dict, correct: list, first: str, bonus: int):
+    for name in correct:
+        scores[name] += 1 + (bonus if name == first else 0)
+    items = list(scores.items())
+    items.sort(key=lambda x: (-x[1], x[0]))
+    ranks = {}
+    prev_score = None
+    rank = 0
+    tie_count = 0
+    for (name, score) in items:
+        if prev_score is None:
+            rank = 1
+            tie_count = 1
+        elif score == prev_score:
+            tie_count += 1
+        else:
+            rank = rank + tie_count
+            tie_count = 1
+        prev_score = score
+        ranks[name] = rank
+    return items[:10], ranks
+
+
+def incremental_round(board: Leaderboard, correct: list, first: str, bonus: int):
+    gained = dict.fromkeys(correct, 1)
+    if first is not None:
+        gained[first] += bonus
+    board.add_points_many(gained)
+    return board.top(10), board.rank_table(), board.leaders()
+
+
+def render(board: Leaderboard) -> str:
+    return "\n".join(f"#{rank}) {name}: {score} points" for (rank, name, score) in board.ranked())
+
+
+def run(players: int, rounds: int, accuracy: float, seed: int):
+    rng = random.Random(seed)
+    names = ["player" + str(i) for i in range(players)]
+    plan = []
+    for _ in range(rounds):
+        correct = [n for n in names if rng.random() < accuracy]
+        plan.append((correct, correct[0] if correct else None))
+    bonus = players - 1
+
+    scores = {n: 0 for n in names}
+    start = time.perf_counter()
+    for correct, first in plan:
+        sort_round(scores, correct, first, bonus)
+    sort_time = (time.perf_counter() - start) / rounds
+
+    board = Leaderboard()
+    for n in names:
+        board.set_score(n, 0)
+    start = time.perf_counter()
+    for correct, first in plan:
+        incremental_round(board, correct, first, bonus)
+    incremental_time = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    render(board)
+    render_time = time.perf_counter() - start
+
+    # Same final standings either way
+    assert [(n, s) for (_, n, s) in board.ranked()] == sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+    return sort_time, incremental_time, render_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-question ranking cost at large room sizes.")
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--accuracy", type=float, default=0.5, help="Share of players answering correctly")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'players':>8} {'sort ms/round':>14} {'incremental ms/round':>21} {'render ms':>10}")
+    for players in args.players:
+        sort_time, incremental_time, render_time = run(players, args.rounds, args.accuracy, args.seed)
+        print(f"{players:>8} {sort_time * 1000:>14.2f} {incremental_time * 1000:>21.2f} {render_time * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
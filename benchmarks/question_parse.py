@@ -0,0 +1,111 @@
+# BENCHMARK: compiling a large question file
+
+# Generates a question file of --lines lines (6 per question including the blank line, with
+# a malformed block every --bad-every questions), then compares:
+#   readlines - the old approach: readlines() and the counter % 5 state machine into dicts
+#   stream    - question_bank.compile_bank: line by line into the binary cache
+#   cached    - open_bank on the unchanged file (memory-mapped cache)
+# and reports lines/s, MB/s and the peak Python memory of each (--memory, slower).
+#   python benchmarks/question_parse.py --lines 3000000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from question_bank import compile_bank, open_bank
+
+
+def generate(path: str, lines: int, bad_every: int):
+    with open(path, "w", encoding="utf-8") as f:
+        written = 0
+        i = 0
+        while written < lines:
+            if bad_every and i % bad_every == bad_every - 1:
+                f.write(f"Broken question {i} with two choices?\nfirst\nsecond\nA\n\n")
+                written += 5
+            else:
+                f.write(f"Question number {i}: which option is right?\nFirst option {i}\n"
+                        f"Second option {i}\nThird option {i}\n{'ABC'[i % 3]}\n\n")
+                written += 6
+            i += 1
+
+
+def readlines_parse(path: str) -> int:
+    questions = []
+    one_question = {}
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    counter = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if counter % 5 == 0:
+            one_question["Question"] = line
+        elif counter % 5 in (1, 2, 3):
+            one_question.setdefault("Choices", []).append(line)
+        else:
+            one_question["Answer"] = line.split()[-1].strip().upper()
+            one_question["Id"] = len(questions)
+            questions.append(one_question.copy())
+            one_question.clear()
+        counter += 1
+    return len(questions)
+
+
+def measure(func, memory: bool):
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question file parsing throughput and memory.")
+    parser.add_argument("--lines", type=int, default=3000000)
+    parser.add_argument("--bad-every", type=int, default=1000, help="One malformed question per this many (0: none)")
+    parser.add_argument("--memory", action="store_true", help="Also trace peak Python memory (slows every run)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "questions.txt")
+        generate(path, args.lines, args.bad_every)
+        size = os.path.getsize(path)
+        print(f"file: {args.lines:,} lines, {size / 1e6:.1f} MB")
+
+        errors = []
+        cache_path = os.path.join(tmp, "questions.qbank")
+
+        def stream():
+            with open(cache_path, "w+b") as out:
+                return compile_bank(path, out, on_error=lambda lineno, msg: errors.append(lineno))
+
+        rows = []
+        count, elapsed, peak = measure(lambda: readlines_parse(path), args.memory)
+        rows.append(("readlines", count, elapsed, peak))
+        stats, elapsed, peak = measure(stream, args.memory)
+        rows.append(("stream", stats.questions, elapsed, peak))
+        (bank, _), elapsed, peak = measure(lambda: open_bank(path, cache_path=cache_path), args.memory)
+        rows.append(("cached", len(bank), elapsed, peak))
+        bank.close()
+
+        print(f"{'parser':10} {'questions':>10} {'seconds':>8} {'lines/s':>12} {'MB/s':>7} {'peak MB':>8}")
+        for name, count, elapsed, peak in rows:
+            peak_text = f"{peak / 1e6:>8.1f}" if args.memory else f"{'-':>8}"
+            print(f"{name:10} {count:>10,} {elapsed:>8.3f} {args.lines / elapsed:>12,.0f} {size / elapsed / 1e6:>7.1f} {peak_text}")
+        print(f"malformed entries reported by stream: {len(errors)} (first at line {errors[0] if errors else '-'})")
+
+
+if __name__ == "__main__":
+    main()
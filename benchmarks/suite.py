@@ -0,0 +1,359 @@
+# BENCHMARK: the server hot paths, compared with stored baselines
+
+# Runs every case a few times and compares the fastest run with benchmarks/baseline.json:
+#   parse/*      - compiling a question file into the bank cache, and reopening the cache
+#   scoreboard/* - Room.format_scoreboard, full boards and the top-K board of a big room
+#   broadcast/*  - Room.broadcast to N clients over socketpairs, until every peer has the bytes
+#   answers/*    - N players' ANSWER messages through Room.handle_message in one round
+#   scoring/*    - Room.score_current_question for N players (YOURRESULT + scoreboard)
+#   round/*      - end to end over loopback: bots against a headless server, median time
+#                  from QUESTION to YOURRESULT
+# Fast cases repeat the operation until one sample takes --min-time, like timeit.
+#   python benchmarks/suite.py                  # everything, compared with the baseline
+#   python benchmarks/suite.py scoreboard round # only cases whose name contains one of these
+#   python benchmarks/suite.py --save           # store this machine's numbers as the baseline
+# The fastest sample is compared (the others mostly measure what else the machine was doing),
+# the median is shown too. A case more than --tolerance slower than its baseline is reported
+# as a regression and the exit status is 1. Baselines only mean something on the machine that
+# saved them, save new ones after changing machines.
+
+import argparse
+import asyncio
+import gc
+import io
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_client import BotClient, LoadStats, free_port, start_server
+from histogram import Histogram
+from log_sink import LogSink
+from protocol import CODECS
+from question_bank import compile_bank, open_bank
+from question_parse import generate
+from quiz_engine import ClientConnection, QuizEngine, raise_fd_limit
+from quiz_room import Room
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+PARSE_LINES = 120000 # 20000 questions
+SCOREBOARD_SIZES = (10, 1000, 10000)
+TOP_K_SIZE = 100000
+BROADCAST_SIZES = (10, 100, 1000)
+ANSWER_SIZES = (100, 1000, 10000)
+ROUND_PLAYERS = 50
+ROUND_QUESTIONS = 10
+
+
+# Stands in for a connection where only the bytes queued matter
+class SinkClient:
+    def __init__(self, name: str, codec):
+        self.name = name
+        self.codec = codec
+        self.queued = 0
+        self.sent_questions = {}
+
+    def send_bytes(self, data: bytes) -> bool:
+        self.queued += len(data)
+        return True
+
+    def send(self, mtype: str, *fields) -> bool:
+        return self.send_bytes(self.codec.encode(mtype, *fields))
+
+    def close(self, discard: bool = False):
+        pass
+
+
+def make_room(players: int, client=None) -> Room:
+    engine = QuizEngine(log=LogSink().log) # Bounded queue, like headless mode before the writer thread
+    engine.is_listening = True
+    room = Room(engine, "bench")
+    for i in range(players):
+        name = "player" + str(i)
+        room.players.add(name, client(name) if client else SinkClient(name, CODECS["text"]))
+    return room
+
+
+# Starts an answering phase the way game_loop does
+def open_round(room: Room, correct: str = "B"):
+    room.game_active = True
+    room.waiting_for_answers = True
+    room.current_correct = correct
+    room.players.clear_answers()
+    room.question_latency = Histogram()
+    room.question_sent_ns = time.monotonic_ns()
+    room.deadline_ns = None
+
+
+def case_parse_compile(tmp: str):
+    path = os.path.join(tmp, "parse.txt")
+    if not os.path.exists(path):
+        generate(path, PARSE_LINES, 1000)
+
+    def run():
+        compile_bank(path, io.BytesIO(), on_error=lambda lineno, msg: None)
+    return run
+
+
+def case_parse_cached(tmp: str):
+    path = os.path.join(tmp, "parse.txt")
+    if not os.path.exists(path):
+        generate(path, PARSE_LINES, 1000)
+    cache = os.path.join(tmp, "parse.qbank")
+    open_bank(path, cache_path=cache)[0].close()
+
+    def run():
+        open_bank(path, cache_path=cache)[0].close()
+    return run
+
+
+def case_scoreboard(players: int, limit=None):
+    room = make_room(0)
+    for i in range(players):
+        room.scores.set_score("player" + str(i), i % 97)
+
+    def run():
+        room.format_scoreboard(True, limit)
+    return run
+
+
+# closers gets a function that closes the connections once the case is measured
+def case_broadcast(loop, players: int, closers: list):
+    peers = []
+    room = make_room(0)
+
+    async def connect():
+        for i in range(players):
+            a, b = socket.socketpair()
+            b.setblocking(False)
+            peers.append(b)
+            reader, writer = await asyncio.open_connection(sock=a)
+            name = "player" + str(i)
+            room.players.add(name, ClientConnection(name, reader, writer, CODECS["text"], b""))
+    loop.run_until_complete(connect())
+
+    message = "MSG", "player123 connected to server. " * 3
+    size = len(CODECS["text"].encode(*message))
+    state = {}
+
+    def readable(peer: socket.socket):
+        try:
+            state["left"] -= len(peer.recv(65536))
+        except BlockingIOError:
+            return
+        if state["left"] <= 0 and not state["done"].done():
+            state["done"].set_result(None)
+
+    for peer in peers:
+        loop.add_reader(peer.fileno(), readable, peer)
+
+    async def once():
+        state["left"] = size * players
+        state["done"] = loop.create_future()
+        room.broadcast(*message)
+        await state["done"]
+
+    async def close():
+        for peer in peers:
+            loop.remove_reader(peer.fileno())
+        clients = list(room.players.values())
+        for client in clients:
+            client.close(discard=True)
+        await asyncio.gather(*(client.writer_task for client in clients))
+        for peer in peers:
+            peer.close()
+    closers.append(lambda: loop.run_until_complete(close()))
+
+    def run():
+        loop.run_until_complete(once())
+    return run
+
+
+def case_answers(players: int):
+    room = make_room(players)
+    names = list(room.players)
+    messages = [["ANSWER", "ABC"[i % 3]] for i in range(players)]
+
+    def run():
+        open_round(room)
+        now = time.monotonic_ns()
+        for name, parts in zip(names, messages):
+            room.handle_message(name, parts, now)
+    return run
+
+
+def case_scoring(players: int):
+    room = make_room(players)
+    for name in room.players:
+        room.scores.set_score(name, 0)
+    names = list(room.players)
+
+    def run():
+        open_round(room)
+        now = time.monotonic_ns()
+        for i, name in enumerate(names):
+            room.process_answer(name, "ABC"[i % 3], now + i)
+        room.score_current_question()
+    return run
+
+
+# One sample is one game of ROUND_PLAYERS bots in a fresh room, its value the median round time
+def case_round(loop, server_port: int):
+    rounds = {"n": 0}
+
+    async def game():
+        rounds["n"] += 1
+        stats = LoadStats()
+        bots = [BotClient("bot" + str(i), "round-" + str(rounds["n"]), "text", stats, random.Random(i))
+                for i in range(ROUND_PLAYERS)]
+        connected = await asyncio.gather(*(bot.connect("127.0.0.1", server_port, 10) for bot in bots))
+        await asyncio.gather(*(bot.play() for bot, ok in zip(bots, connected) if ok))
+        if stats.finished != ROUND_PLAYERS:
+            raise RuntimeError("round benchmark: only " + str(stats.finished) + " bots finished the game")
+        return stats.round_time.percentile(0.5) / 1e6
+
+    def run():
+        return loop.run_until_complete(game())
+    return run
+
+
+def start_round_server():
+    args = argparse.Namespace(bots=ROUND_PLAYERS, rooms=1, questions=os.path.join(ROOT, "sample_questions.txt"),
+                              num_questions=ROUND_QUESTIONS, workers=1, time_limit=None, server_log="")
+    port = free_port()
+    return port, start_server(port, args)
+
+
+# Seconds per operation of each sample. run() returning a number means it timed itself.
+# The garbage collector is off while timing, as in timeit, collections would land in random samples.
+def measure(run, repeat: int, min_time: float) -> list:
+    start = time.perf_counter()
+    value = run() # Warm up, and find out what kind of case this is
+    if value is not None:
+        return [run() for _ in range(repeat)]
+
+    gc.collect()
+    gc.disable()
+    try:
+        number = 1
+        while time.perf_counter() - start < min_time and number < 1 << 20:
+            number *= 2
+            start = time.perf_counter()
+            for _ in range(number):
+                run()
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                run()
+            samples.append((time.perf_counter() - start) / number)
+    finally:
+        gc.enable()
+    return samples
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.3f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of the server hot paths.")
+    parser.add_argument("filters", nargs="*", help="Only run cases whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=7, help="Samples per case")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Seconds a single sample should take at least")
+    parser.add_argument("--tolerance", type=float, default=0.4, help="Allowed slowdown of the fastest sample before it counts as a regression")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="Store the results of this run as the baseline")
+    args = parser.parse_args()
+    raise_fd_limit()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    tmp = tempfile.TemporaryDirectory()
+    server = None
+    closers = []
+
+    cases = [("parse/compile-20k", lambda: case_parse_compile(tmp.name)),
+             ("parse/cached-20k", lambda: case_parse_cached(tmp.name))]
+    for n in SCOREBOARD_SIZES:
+        cases.append((f"scoreboard/full-{n}", lambda n=n: case_scoreboard(n)))
+    cases.append((f"scoreboard/top10-{TOP_K_SIZE}", lambda: case_scoreboard(TOP_K_SIZE, 10)))
+    for n in BROADCAST_SIZES:
+        cases.append((f"broadcast/{n}", lambda n=n: case_broadcast(loop, n, closers)))
+    for n in ANSWER_SIZES:
+        cases.append((f"answers/{n}", lambda n=n: case_answers(n)))
+        cases.append((f"scoring/{n}", lambda n=n: case_scoring(n)))
+
+    def round_case():
+        nonlocal server
+        port, server = start_round_server()
+        return case_round(loop, port)
+    cases.append((f"round/loopback-{ROUND_PLAYERS}", round_case))
+
+    if args.filters:
+        cases = [(name, setup) for name, setup in cases if any(f in name for f in args.filters)]
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    base_cases = baseline.get("cases", {})
+    env = {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system()}
+    if base_cases and baseline.get("env") != env and not args.save:
+        print(f"note: baseline was saved on {baseline.get('env')}, this is {env}")
+
+    results = {}
+    regressions = []
+    print(f"{'case':24} {'best':>11} {'median':>11} {'stdev':>10} {'baseline':>11} {'change':>8}")
+    try:
+        for name, setup in cases:
+            samples = measure(setup(), args.repeat, args.min_time)
+            while closers:
+                closers.pop()()
+            best = min(samples)
+            median = statistics.median(samples)
+            stdev = statistics.stdev(samples) if len(samples) > 1 else 0.0
+            results[name] = {"best": best, "median": median, "stdev": stdev}
+
+            base = base_cases.get(name)
+            base_text, change_text = "-", "-"
+            if base:
+                change = best / base["best"] - 1
+                base_text = format_seconds(base["best"])
+                change_text = f"{change * 100:+.1f}%"
+                if change > args.tolerance:
+                    regressions.append(name)
+                    change_text += " !"
+            print(f"{name:24} {format_seconds(best):>11} {format_seconds(median):>11} {format_seconds(stdev):>10} {base_text:>11} {change_text:>8}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        loop.close()
+        tmp.cleanup()
+
+    if args.save:
+        base_cases.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"env": env, "cases": base_cases}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"REGRESSIONS (more than {args.tolerance * 100:.0f}% slower): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
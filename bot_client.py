@@ -0,0 +1,334 @@
+# BOT CLIENT
+
+# Headless simulated players to put load on a server, thousands of them in one process:
+#   python bot_client.py --serve --bots 2000 --rooms 20 --think 0.5 --accuracy 0.7
+# Every bot is a ClientProtocol (the same message handling as the Tk client) on an asyncio
+# connection. It answers each question after a think time, correctly with the given
+# probability when it knows the answers (--questions, the file the server asks from) and at
+# random otherwise. --serve starts a headless quiz_engine.py on a free localhost port that
+# auto-starts each room once all its bots are in, without it the bots join --host/--port.
+# With --games N each bot plays N games on one connection as a lobby client, sending READY
+# after every GAMEOVER instead of reconnecting.
+# At the end it reports how fast the bots connected, the latency from question to answer
+# to result, and how many connections failed, were rejected or dropped.
+
+import argparse
+import asyncio
+import collections
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from client_protocol import ANSWERS, ClientProtocol, MAX_SERVER_FRAME
+from framing import FrameTooLong, RECV_SIZE
+from histogram import Histogram, format_us
+from protocol import CODECS, ProtocolError, make_handshake
+from question_bank import open_bank
+from quiz_engine import raise_fd_limit
+
+MAX_ERROR_KINDS = 5 # Distinct ERROR texts shown in the report
+
+
+# Counters and latency histograms (microseconds) shared by all bots
+class LoadStats:
+    def __init__(self):
+        self.connected = 0
+        self.connect_failed = 0
+        self.rejected = 0 # Got ERROR| (duplicate name, game running, server busy)
+        self.dropped = 0 # Connection closed before GAMEOVER
+        self.finished = 0 # Games played until GAMEOVER
+        self.answers = 0
+        self.correct = 0
+        self.errors = collections.Counter()
+        self.unfinished = 0 # Still playing when --duration ran out
+        self.first_connect = None
+        self.last_connect = None
+        self.connect_time = Histogram() # Connect + handshake until the first server message
+        self.answer_rtt = Histogram() # ANSWER sent until YOURRESULT, includes waiting for the room
+        self.round_time = Histogram() # QUESTION received until YOURRESULT
+        self.next_game = Histogram() # GAMEOVER until the next game's first QUESTION (--games)
+
+
+class BotClient(ClientProtocol):
+    def __init__(self, name: str, room: str, codec: str, stats: LoadStats, rng: random.Random,
+                 think: float = 0.0, jitter: float = 0.0, accuracy: float = 1.0, answers=None, games: int = 1):
+        self.name = name
+        self.room = room
+        self.codec = CODECS[codec]
+        self.stats = stats
+        self.rng = rng
+        self.think = think # Mean seconds before answering
+        self.jitter = jitter # Think time varies by up to this share of it
+        self.accuracy = accuracy # Chance of a correct answer, when answers is known
+        self.answers = answers # Question text -> correct letter, None answers at random
+        self.games_left = games
+        self.lobby = games > 1 # Stay connected between games
+        self.reader = None
+        self.writer = None
+        self.decoder = None
+        self.is_connected = False
+        self.finished = False
+        self.rejected = False
+        self.pending = None # Timer of the answer being "thought about"
+        self.question_ns = 0
+        self.answered_ns = 0
+        self.gameover_ns = 0
+
+    def disconnect(self):
+        if not self.is_connected:
+            return
+        self.is_connected = False
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        self.writer.close()
+
+    # Connects and sends the handshake, True once the server's first message arrived
+    async def connect(self, host: str, port: int, timeout: float) -> bool:
+        stats = self.stats
+        start = time.monotonic_ns()
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            stats.connect_failed += 1
+            return False
+        self.is_connected = True
+        self.writer.write(make_handshake(self.name, self.codec.name, self.room, self.lobby))
+        try:
+            data = await asyncio.wait_for(self.reader.read(RECV_SIZE), timeout)
+        except (OSError, asyncio.TimeoutError):
+            data = b""
+        if not data:
+            stats.connect_failed += 1
+            self.disconnect()
+            return False
+
+        now = time.monotonic_ns()
+        stats.connected += 1
+        stats.connect_time.record((now - start) // 1000)
+        if stats.first_connect is None:
+            stats.first_connect = now
+        stats.last_connect = now
+        self.decoder = self.codec.decoder(MAX_SERVER_FRAME)
+        self.decoder.feed(data)
+        return True
+
+    # Handles server messages until GAMEOVER, ERROR or the connection closing
+    async def play(self):
+        while self.is_connected:
+            try:
+                for parts in self.decoder.messages():
+                    self.handle_server_message(parts)
+                    if not self.is_connected:
+                        break
+            except (FrameTooLong, ProtocolError):
+                break
+            if not self.is_connected:
+                break
+            try:
+                data = await self.reader.read(RECV_SIZE)
+            except (ConnectionError, OSError):
+                break
+            if not data:
+                break
+            self.decoder.feed(data)
+
+        if not self.finished and not self.rejected:
+            self.stats.dropped += 1
+        self.disconnect()
+
+    def on_error(self, text: str):
+        self.rejected = True
+        self.stats.rejected += 1
+        self.stats.errors[text] += 1
+        self.disconnect()
+
+    def on_question(self, text: str, choices: list, idx: str, total: str):
+        self.question_ns = time.monotonic_ns()
+        if self.gameover_ns:
+            self.stats.next_game.record((self.question_ns - self.gameover_ns) // 1000)
+            self.gameover_ns = 0
+        correct = self.answers.get(text) if self.answers else None
+        if correct is None:
+            ans = self.rng.choice(ANSWERS)
+        elif self.rng.random() < self.accuracy:
+            ans = correct
+        else:
+            ans = self.rng.choice([a for a in ANSWERS if a != correct])
+        delay = self.think * (1 + self.jitter * (2 * self.rng.random() - 1))
+        if self.pending is not None:
+            self.pending.cancel()
+        self.pending = asyncio.get_running_loop().call_later(max(0.0, delay), self.send_answer, ans)
+
+    def send_answer(self, ans: str):
+        self.pending = None
+        if not self.is_connected:
+            return
+        self.answered_ns = time.monotonic_ns()
+        self.writer.write(self.answer_message(ans))
+        self.stats.answers += 1
+
+    def on_result(self, text: str):
+        now = time.monotonic_ns()
+        if self.pending is not None: # Round ended (time limit) before the bot answered
+            self.pending.cancel()
+            self.pending = None
+        elif self.answered_ns:
+            self.stats.answer_rtt.record((now - self.answered_ns) // 1000)
+        if self.question_ns:
+            self.stats.round_time.record((now - self.question_ns) // 1000)
+        self.answered_ns = 0
+        if text.startswith("Correct"):
+            self.stats.correct += 1
+
+    def on_gameover(self, text: str):
+        self.stats.finished += 1
+        self.games_left -= 1
+        if self.games_left > 0:
+            self.gameover_ns = time.monotonic_ns()
+            self.writer.write(self.ready_message())
+            return
+        self.finished = True
+        self.disconnect()
+
+
+# Question text -> correct letter of a question file
+def load_answers(filename: str) -> dict:
+    bank, _ = open_bank(filename)
+    answers = {q.text: q.answer for q in bank}
+    bank.close()
+    return answers
+
+
+def free_port() -> int:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+# Starts a headless server for the bots, returns the process once it accepts connections.
+# extra is appended to the server's command line.
+def start_server(port: int, args, extra=()) -> subprocess.Popen:
+    per_room = -(-args.bots // args.rooms)
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz_engine.py"),
+           "--host", "127.0.0.1", "--port", str(port), "--questions", args.questions,
+           "--num-questions", str(args.num_questions), "--auto-start", str(per_room),
+           "--workers", str(args.workers), "--max-pending-handshakes", str(max(4096, args.bots))]
+    if args.time_limit is not None:
+        cmd += ["--time-limit", str(args.time_limit)]
+    cmd += list(extra)
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("Server did not start listening.")
+
+
+async def run_bots(args, answers) -> LoadStats:
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    bots = []
+    for i in range(args.bots):
+        room = args.room if args.rooms == 1 else args.room + "-" + str(i % args.rooms)
+        bots.append(BotClient("bot" + str(i), room, args.codec, stats, random.Random(rng.random()),
+                              args.think, args.jitter, args.accuracy, answers, args.games))
+
+    async def start(bot: BotClient, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        async with semaphore: # Only connecting is limited, the bot then plays on its own
+            connected = await bot.connect(args.host, args.port, args.connect_timeout)
+        if connected:
+            await bot.play()
+
+    interval = 1 / args.connect_rate if args.connect_rate else 0.0
+    tasks = [asyncio.ensure_future(start(bot, i * interval)) for i, bot in enumerate(bots)]
+    done, pending = await asyncio.wait(tasks, timeout=args.duration)
+    for task in pending:
+        task.cancel()
+    for bot in bots:
+        bot.disconnect()
+    await asyncio.gather(*pending, return_exceptions=True)
+    stats.unfinished = len(pending)
+    return stats
+
+
+def report(stats: LoadStats, args, elapsed: float):
+    print(f"bots:              {args.bots} in {args.rooms} room(s), think {args.think}s +-{args.jitter * 100:.0f}%, accuracy {args.accuracy}")
+    print(f"connected:         {stats.connected}/{args.bots} ({stats.connect_failed} failed to connect, {stats.rejected} rejected)")
+    if stats.connected > 1 and stats.last_connect > stats.first_connect:
+        print(f"connect rate:      {stats.connected / ((stats.last_connect - stats.first_connect) / 1e9):,.0f} connections/s")
+    print(f"connect time:      {stats.connect_time.summary(format_us)}")
+    print(f"answer -> result:  {stats.answer_rtt.summary(format_us)}")
+    print(f"round time:        {stats.round_time.summary(format_us)}")
+    if args.games > 1:
+        print(f"next game after:   {stats.next_game.summary(format_us)}")
+    print(f"answers:           {stats.answers} sent, {stats.correct} scored correct")
+    print(f"finished games:    {stats.finished}, dropped connections: {stats.dropped}, still running at --duration: {stats.unfinished}")
+    for text, count in stats.errors.most_common(MAX_ERROR_KINDS):
+        print(f"  ERROR x{count}: {text}")
+    print(f"elapsed:           {elapsed:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator: headless bot players for the quiz server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--serve", action="store_true", help="Start a headless server on a free localhost port for the run")
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument("--rooms", type=int, default=1, help="Spread the bots over this many rooms (ROOM-0, ROOM-1, ...)")
+    parser.add_argument("--room", default="load", help="Room name, or name prefix with --rooms")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="text")
+    parser.add_argument("--think", type=float, default=0.2, help="Mean seconds before answering")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Think time varies by up to this share (0..1)")
+    parser.add_argument("--accuracy", type=float, default=0.7, help="Chance of a correct answer (needs the answers from --questions)")
+    parser.add_argument("--questions", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_questions.txt"),
+                        help="Question file the server asks from, gives the bots the answers ('' to answer at random)")
+    parser.add_argument("--connect-rate", type=float, default=0, help="New connections per second (0: as fast as possible)")
+    parser.add_argument("--connect-concurrency", type=int, default=256, help="Connections being opened at once")
+    parser.add_argument("--connect-timeout", type=float, default=10.0)
+    parser.add_argument("--games", type=int, default=1, help="Games each bot plays on one connection (lobby mode above 1)")
+    parser.add_argument("--duration", type=float, default=120.0, help="Stop after this many seconds even if games still run")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the bots' think times and answers")
+    parser.add_argument("--num-questions", type=int, default=5, help="With --serve: questions per game")
+    parser.add_argument("--time-limit", type=float, default=None, help="With --serve: answer time limit in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="With --serve: server worker processes")
+    parser.add_argument("--server-log", default="", help="With --serve: write the server's log to this file")
+    args = parser.parse_args()
+
+    if args.bots <= 0 or args.rooms <= 0 or args.games <= 0:
+        parser.error("--bots, --rooms and --games must be > 0")
+    if args.serve and not args.questions:
+        parser.error("--serve needs --questions")
+    answers = load_answers(args.questions) if args.questions else None
+    raise_fd_limit()
+
+    proc = None
+    if args.serve:
+        args.host = "127.0.0.1"
+        args.port = free_port()
+        proc = start_server(args.port, args)
+    start = time.perf_counter()
+    try:
+        stats = asyncio.run(run_bots(args, answers))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+    report(stats, args, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
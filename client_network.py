@@ -0,0 +1,117 @@
+# CLIENT NETWORK
+
+# The Tk client's connection, without any UI. Each connection has two daemon threads:
+#   receive thread - connects, sends the handshake, then reads into one reusable buffer and
+#                    splits the stream into messages with the codec's decoder
+#   send thread    - writes what send() queued, so a slow link never blocks the caller
+# Nothing here touches Tk. What happens is appended to the events deque (thread-safe, no
+# lock, like LogSink) and the window takes it from there in batches on its own main loop
+# (QuizClient.poll_events). Events are tuples:
+#   ("connected",)              the handshake is sent
+#   ("connect_failed", error)   the connection could not be made
+#   ("message", parts)          one decoded server message, [TYPE, field, ...]
+#   ("closed", reason)          the connection is gone (not sent after close())
+
+import collections
+import queue
+import socket
+import threading
+
+from framing import FrameTooLong, RECV_SIZE
+from protocol import ProtocolError
+
+CONNECT_TIMEOUT = 10 # Seconds
+
+
+class NetworkClient:
+    def __init__(self, codec, max_frame: int):
+        self.codec = codec
+        self.max_frame = max_frame
+        self.events = collections.deque()
+        self.outbox = queue.Queue() # Encoded messages for the send thread, None stops it
+        self.sock = None
+        self.closing = False # close() was called
+        self.finished = False # The connection is over, only reported once
+        self.lock = threading.Lock()
+
+    # Starts connecting in the background, the result comes as an event
+    def start(self, ip: str, port: int, handshake: bytes):
+        threading.Thread(target=self.receive_loop, args=(ip, port, handshake), daemon=True).start()
+
+    # Queues an encoded message, never blocks
+    def send(self, data: bytes):
+        self.outbox.put(data)
+
+    # Safe to call from any thread, wakes up both threads
+    def close(self):
+        self.closing = True
+        self.outbox.put(None)
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    # Ends the connection once, whichever thread notices first
+    def finish(self, event=None):
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+        self.outbox.put(None)
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        if event is not None and not self.closing:
+            self.events.append(event)
+
+    def receive_loop(self, ip: str, port: int, handshake: bytes):
+        try:
+            sock = socket.create_connection((ip, port), timeout=CONNECT_TIMEOUT)
+        except OSError as e:
+            self.finish(("connect_failed", str(e)))
+            return
+        self.sock = sock
+        if self.closing: # close() came while connecting
+            self.finish()
+            return
+
+        try:
+            sock.settimeout(None)
+            sock.sendall(handshake)
+        except OSError as e:
+            self.finish(("connect_failed", str(e)))
+            return
+        self.events.append(("connected",))
+        threading.Thread(target=self.send_loop, daemon=True).start()
+
+        decoder = self.codec.decoder(self.max_frame)
+        recv_buffer = memoryview(bytearray(RECV_SIZE))
+        events = self.events
+        while not self.closing:
+            try:
+                n = sock.recv_into(recv_buffer)
+                if n == 0:
+                    self.finish(("closed", "SERVER CLOSED CONNECTION."))
+                    return
+                decoder.feed(recv_buffer[:n])
+                for parts in decoder.messages():
+                    events.append(("message", parts))
+            except (OSError, FrameTooLong, ProtocolError) as e:
+                self.finish(("closed", "CONNECTION LOST: " + str(e)))
+                return
+        self.finish()
+
+    def send_loop(self):
+        while True:
+            data = self.outbox.get()
+            if data is None or self.finished:
+                return
+            try:
+                self.sock.sendall(data)
+            except OSError as e:
+                self.finish(("closed", "SEND FAILED: " + str(e)))
+                return
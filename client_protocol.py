@@ -0,0 +1,117 @@
+# CLIENT PROTOCOL
+
+# What a client does with the messages the server sends, without any UI. handle_server_message
+# turns each decoded message into one on_* call. The defaults only log (and disconnect on
+# ERROR and GAMEOVER). The Tk client (client_side.py) overrides them to update its window and
+# the headless bots (bot_client.py) to answer questions. Subclasses provide log(msg) and
+# disconnect(). A lobby client (lobby = True, asked for in the handshake) stays connected
+# after GAMEOVER and sends ready_message() to play the next game.
+
+from protocol import CODECS
+
+MAX_SERVER_FRAME = 16 * 1024 * 1024 # Full scoreboards of big rooms are long lines
+ANSWERS = ("A", "B", "C")
+
+
+class ClientProtocol:
+    codec = CODECS["text"] # Wire format of the current connection (see protocol.py)
+    lobby = False
+
+    def log(self, msg: str):
+        pass
+
+    def disconnect(self):
+        pass
+
+    # Function to handle different types of messages coming from the server
+    # Has custom types like ERROR, QUESTION, SCORE etc. so client program knows what to do
+    def handle_server_message(self, parts: list):
+        # Protocol: TYPE|payload... (already split into [TYPE, field, ...] by the decoder)
+        mtype = parts[0].strip()
+
+        if mtype == "ERROR":
+            self.on_error(parts[1] if len(parts) > 1 else "Unknown server error.")
+
+        elif mtype == "MSG":
+            self.on_message(parts[1] if len(parts) > 1 else "")
+
+        elif mtype == "QUESTION":
+            # QUESTION|q|choiceA|choiceB|choiceC|idx|total
+            if len(parts) >= 7:
+                self.on_question(parts[1], parts[2:5], parts[5], parts[6])
+            else:
+                self.log("--- Malformed QUESTION message received. ---")
+
+        elif mtype == "YOURRESULT":
+            self.on_result(parts[1] if len(parts) > 1 else "")
+
+        elif mtype == "MYRANK":
+            # Personal standing, sent with the top-K scoreboard in big rooms
+            # MYRANK|rank|score|players|above name|above score|below name|below score
+            if len(parts) >= 8:
+                self.on_rank(*parts[1:8])
+            else:
+                self.log("--- Malformed MYRANK message received. ---")
+
+        elif mtype == "SCORE":
+            self.on_scoreboard(self.board_text(parts))
+
+        elif mtype == "GAMEOVER":
+            self.on_gameover(self.board_text(parts))
+
+        else:
+            # If server sends something that is not defined
+            self.log("UNKNOWN SERVER MESSAGE: " + "|".join(parts))
+
+    # Scoreboard text of a SCORE/GAMEOVER message
+    def board_text(self, parts: list) -> str:
+        text = "|".join(parts[1:]) if len(parts) > 1 else ""
+        return text.replace("\\n", "\n")
+
+    # The encoded ANSWER message for a choice, None if it isn't A, B or C
+    def answer_message(self, ans: str):
+        ans = ans.strip().upper()
+        if ans not in ANSWERS:
+            return None
+        return self.codec.encode("ANSWER", ans)
+
+    def ready_message(self) -> bytes:
+        return self.codec.encode("READY")
+
+    def on_error(self, text: str):
+        self.log("! Server Error !: " + text)
+        self.disconnect()
+
+    def on_message(self, text: str):
+        self.log(text)
+
+    # choices is [A, B, C], idx and total are the strings the server sent
+    def on_question(self, text: str, choices: list, idx: str, total: str):
+        self.log(f"--- Question {idx} received. Submit your answer. ---")
+
+    def on_result(self, text: str):
+        self.log(text)
+
+    def on_rank(self, rank, score, players, above, above_score, below, below_score):
+        self.log(f"--- Your rank: #{rank} of {players} with {score} points ---")
+        if above:
+            self.log(f"    Above you: {above} ({above_score} points)")
+        if below:
+            self.log(f"    Below you: {below} ({below_score} points)")
+
+    def on_scoreboard(self, text: str):
+        self.log("--- Scoreboard Update ---")
+        for line in text.split("\n"):
+            self.log(line)
+        self.log("--- End Scoreboard ---")
+
+    def on_gameover(self, text: str):
+        self.log("########################################")
+        self.log("##########    G A M E   O V E R   ##########")
+        for line in text.split("\n"):
+            self.log(line)
+        self.log("########################################")
+        if self.lobby:
+            return
+        self.log("\nDisconnecting from the server...")
+        self.disconnect()
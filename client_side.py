@@ -1,33 +1,52 @@
 # CLIENT
 
+# The window only does UI work. The connection (connect, receive, framing, sending) runs on
+# its own threads in client_network.NetworkClient, which queues decoded messages as events.
+# The Tk main loop takes them in batches every POLL_MS (right away while a burst is still
+# queued), so a flood of SCORE/MSG lines can't freeze the window, and submitting an answer
+# only queues it.
+
 import tkinter as tk
 from tkinter import messagebox
-import socket
-import threading
 
-class QuizClient:
+from client_network import NetworkClient
+from client_protocol import ClientProtocol, MAX_SERVER_FRAME
+from log_sink import LogHistory, LogSink, TkLogView
+from protocol import CODECS, make_handshake
+
+POLL_MS = 50
+EVENT_BATCH = 500 # Server messages handled per poll
+
+class QuizClient(ClientProtocol):
     def __init__(self, master: tk.Tk):
         self.master = master
         master.title("Quiz - Client")
         master.grid_columnconfigure(index=list(range(4)), weight=1)
         master.grid_rowconfigure(index=list(range(6)), weight=1)
 
-        self.client_socket = None
-        self.is_connected = False
-        self.listen_thread = None # The thread that will listen to the server for messages
+        self.net = None # NetworkClient of the current connection
+        self.is_connected = False # Connecting or connected
+        self.connected_text = "" # Logged once the connection is up
+        self.codec = CODECS["text"] # Wire format of the current connection (see protocol.py)
+
+        # Lines are queued and shown by the Tk main loop in batches
+        self.log_sink = LogSink()
 
         # Chosen answer, default at start is "A"
         self.answer_var = tk.StringVar(value="A")
+        self.binary_var = tk.BooleanVar(value=False) # Ask the server for the binary protocol
+        self.lobby_var = tk.BooleanVar(value=False) # Stay connected and play the next game too
 
         self.create_widgets()
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.poll_id = self.master.after(POLL_MS, self.poll_events)
 
     # Create the GUI
     def create_widgets(self):
         # Connection Frame (includes IP, Port and Name fields)
         conn = tk.Frame(self.master)
         conn.grid(row=0, column=0, columnspan=4, padx=10, pady=10, sticky="NWSE")
-        conn.grid_columnconfigure(index=list(range(6)), weight=1)
+        conn.grid_columnconfigure(index=list(range(10)), weight=1)
 
         # IP Entry Field
         tk.Label(conn, text="Server IP:").grid(row=0, column=0, sticky="E")
@@ -44,6 +63,17 @@ class QuizClient:
         self.name_entry = tk.Entry(conn)
         self.name_entry.grid(row=0, column=5, sticky="WE")
 
+        # Room Entry Field, empty joins the server's default room
+        tk.Label(conn, text="Room:").grid(row=0, column=6, sticky="E")
+        self.room_entry = tk.Entry(conn)
+        self.room_entry.grid(row=0, column=7, sticky="WE")
+
+        # Protocol choice, binary is smaller and faster to parse
+        tk.Checkbutton(conn, text="Binary protocol", variable=self.binary_var).grid(row=0, column=8, sticky="W")
+
+        # Lobby mode, the connection stays open after a game and the next one starts without reconnecting
+        tk.Checkbutton(conn, text="Stay for next game", variable=self.lobby_var).grid(row=0, column=9, sticky="W")
+
         # Connect Button
         self.connect_button = tk.Button(self.master, text="Connect", command=self.toggle_connection)
         self.connect_button.grid(row=1, column=0, columnspan=2, padx=10, sticky="WE")
@@ -64,8 +94,9 @@ class QuizClient:
 
         sb = tk.Scrollbar(log_frame, orient="vertical")
         sb.grid(row=0, column=1, sticky="NS")
-        self.log_list.config(yscrollcommand=sb.set)
-        sb.config(command=self.log_list.yview)
+
+        # Only the visible rows live in the Listbox, the newest lines are kept in memory
+        self.log_view = TkLogView(self.master, self.log_list, sb, self.log_sink, LogHistory(max_lines=10000))
 
         # Question Box
         self.q_text = tk.Text(self.master, height=6, state=tk.DISABLED) # Disabled at start
@@ -98,8 +129,7 @@ class QuizClient:
 
     # Helper function that logs the message into the activity log
     def log(self, msg: str):
-        self.log_list.insert(tk.END, msg)
-        self.log_list.yview(tk.END)
+        self.log_sink.log(msg)
 
     # Helper function that prints the incoming question to the question box
     def set_question_display(self, msg: str):
@@ -120,164 +150,115 @@ class QuizClient:
         ip = self.ip_entry.get().strip()
         port_str = self.port_entry.get().strip()
         name = self.name_entry.get().strip()
+        room = self.room_entry.get().strip()
 
         # If any necessery fields are left empty
         if not ip or not port_str or not name:
             messagebox.showerror("Error", "IP, Port, and Name must be filled.")
             return
+        if "|" in name or "|" in room:
+            messagebox.showerror("Error", "Name and Room can't contain '|'.")
+            return
 
         try:
             port = int(port_str)
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.connect((ip, port))
-            self.is_connected = True
-
-            # Send name first to if it's a duplicate
-            self.client_socket.sendall(name.encode())
-
-            # Create the thread that will watch for incoming messages from the server
-            self.listen_thread = threading.Thread(target=self.receive_loop, daemon=True)
-            self.listen_thread.start()
+        except ValueError as e:
+            messagebox.showerror("Connection Error", f"Could not connect: {e}")
+            return
 
-            self.connect_button.config(state=tk.DISABLED)
-            self.disconnect_button.config(state=tk.NORMAL)
+        # Send name first to if it's a duplicate, together with the protocol we want. The
+        # connect and the handshake happen on the network thread, the window stays responsive.
+        self.codec = CODECS["binary" if self.binary_var.get() else "text"]
+        self.lobby = self.lobby_var.get()
+        self.net = NetworkClient(self.codec, MAX_SERVER_FRAME)
+        self.net.start(ip, port, make_handshake(name, self.codec.name, room, self.lobby))
+        self.is_connected = True
 
-            self.log("CONNECTED to "+ ip + ":" + str(port) + " as '" + name + "'")
-            self.log("Waiting for server messages...")
+        self.connect_button.config(state=tk.DISABLED)
+        self.disconnect_button.config(state=tk.NORMAL)
 
-        except (socket.error, ValueError) as e:
-            messagebox.showerror("Connection Error", f"Could not connect: {e}")
-            self.is_connected = False
-            try:
-                if self.client_socket:
-                    self.client_socket.close()
-            except (socket.error, OSError):
-                pass
-            self.client_socket = None
+        self.connected_text = "CONNECTED to "+ ip + ":" + str(port) + " as '" + name + "'" + (" in room '" + room + "'" if room else "")
+        self.log("CONNECTING to " + ip + ":" + str(port) + "...")
 
-    def disconnect(self):
+    # Closes the connection and resets the buttons, returns False if there was none
+    def drop_connection(self) -> bool:
         if not self.is_connected:
-            return
+            return False
         self.is_connected = False
-        try:
-            if self.client_socket:
-                self.client_socket.close()
-        except (socket.error, OSError):
-            pass
-        self.client_socket = None
+        if self.net is not None:
+            self.net.close()
+        self.net = None # Events it still had queued are dropped with it
 
         self.connect_button.config(state=tk.NORMAL)
         self.disconnect_button.config(state=tk.DISABLED)
         self.submit_button.config(state=tk.DISABLED)
+        return True
 
-        self.log("DISCONNECTED.")
-
-
-    # Function to keep listening to the server for messages
-    def receive_loop(self):
-        buffer = ""
-        while self.is_connected:
-            try:
-                chunk = self.client_socket.recv(1024).decode()
-                if not chunk:
-                    self.log("SERVER CLOSED CONNECTION.")
-                    self.disconnect()
-                    break
-
-                buffer += chunk
-
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    line = line.strip()
-                    if line:
-                        self.handle_server_message(line)
-
-            except (socket.error, OSError):
-                self.disconnect() # In case error happens while reading
-                break
-
-    # Function to handle different types of messages coming from the server
-    # We use a custom formatting since we can only send raw messages
-    # Has custom types like ERROR, QUESSTION, SCORE etc. so client program knows what to do
-    def handle_server_message(self, msg: str):
-        # Protocol: TYPE|payload...
-        parts = msg.split("|")
-        mtype = parts[0].strip()
-
-        if mtype == "ERROR":
-            # Display the error in log and messagebox
-            text = parts[1] if len(parts) > 1 else "Unknown server error."
-            self.log("! Server Error !: " + text)
-            messagebox.showerror("Server Error", text)
-            self.disconnect()
+    def disconnect(self):
+        if self.drop_connection():
+            self.log("DISCONNECTED.")
+
+    # Handles what the network thread queued, at most EVENT_BATCH events per call
+    def poll_events(self):
+        handled = 0
+        net = self.net
+        while net is not None and net is self.net and net.events and handled < EVENT_BATCH:
+            event = net.events.popleft()
+            handled += 1
+            kind = event[0]
+            if kind == "message":
+                self.handle_server_message(event[1]) # ERROR or GAMEOVER end the connection
+            elif kind == "connected":
+                self.log(self.connected_text)
+                self.log("Waiting for server messages...")
+            elif kind == "connect_failed":
+                self.drop_connection()
+                messagebox.showerror("Connection Error", f"Could not connect: {event[1]}")
+            elif kind == "closed":
+                self.log(event[1])
+                self.disconnect()
+        # Come back right away if a burst is still queued
+        delay = 1 if self.net is not None and self.net.events else POLL_MS
+        self.poll_id = self.master.after(delay, self.poll_events)
+
+    # The server's messages are dispatched by ClientProtocol.handle_server_message, these
+    # add the window updates to its logging
+    def on_error(self, text: str):
+        # Display the error in log and messagebox
+        self.log("! Server Error !: " + text)
+        messagebox.showerror("Server Error", text)
+        self.disconnect()
+
+    def on_question(self, text: str, choices: list, idx: str, total: str):
+        # Format the question in a readable way to print to screen
+        question = ""
+        question += f"QUESTION {idx}/{total}\n"
+        question += text + "\n\n"
+        question += "A) " + choices[0] + "\n"
+        question += "B) " + choices[1] + "\n"
+        question += "C) " + choices[2] + "\n"
+        question += "\nSelect A/B/C and press Submit."
+
+        self.set_question_display(question)
+        super().on_question(text, choices, idx, total)
+
+        # Enable submit button
+        self.submit_button.config(state=tk.NORMAL)
+
+    def on_result(self, text: str):
+        super().on_result(text)
+        # Disable submit button after a result, to avoid sending multiple answers before receiving a new question
+        self.submit_button.config(state=tk.DISABLED)
 
-        elif mtype == "MSG":
-            # Display generic message in log
-            text = parts[1] if len(parts) > 1 else ""
-            self.log(text)
-
-        elif mtype == "QUESTION":
-            # Display incoming question
-            # QUESTION|q|choiceA|choiceB|choiceC|idx|total
-            if len(parts) >= 7:
-                q = parts[1]
-                ca = parts[2]
-                cb = parts[3]
-                cc = parts[4]
-                idx = parts[5]
-                total = parts[6]
-
-                # Format the question in a readable way to print to screen
-                question = ""
-                question += f"QUESTION {idx}/{total}\n"
-                question += q + "\n\n"
-                question += "A) " + ca + "\n"
-                question += "B) " + cb + "\n"
-                question += "C) " + cc + "\n"
-                question += "\nSelect A/B/C and press Submit."
-
-                self.set_question_display(question)
-                self.log(f"--- Question {idx} received. Submit your answer. ---")
-
-                # Enable submit button
-                self.submit_button.config(state=tk.NORMAL)
-            else:
-                self.log("--- Malformed QUESTION message received. ---")
-
-        elif mtype == "YOURRESULT":
-            # Display personal result in log
-            text = parts[1] if len(parts) > 1 else ""
-            self.log(text)
-
-            # Disable submit button after a result, to avoid sending multiple answers before receiving a new question
-            self.submit_button.config(state=tk.DISABLED)
-
-        elif mtype == "SCORE":
-            # Display scoreboard in log
-            text = "|".join(parts[1:]) if len(parts) > 1 else ""
-            text = text.replace("\\n", "\n")
-            self.log("--- Scoreboard Update ---")
-            for line in text.split("\n"):
-                self.log(line)
-            self.log("--- End Scoreboard ---")
-
-        elif mtype == "GAMEOVER":
-            # Display final scoreboard in log
-            text = "|".join(parts[1:]) if len(parts) > 1 else ""
-            text = text.replace("\\n", "\n")
-            self.log("########################################")
-            self.log("##########    G A M E   O V E R   ##########")
-            for line in text.split("\n"):
-                self.log(line)
-            self.log("########################################")
-            self.submit_button.config(state=tk.DISABLED)
-            self.log("\nDisconnecting from the server...")
-            self.set_question_display("")
-            self.disconnect()
+    def on_gameover(self, text: str):
+        self.submit_button.config(state=tk.DISABLED)
+        self.set_question_display("")
+        super().on_gameover(text)
 
-        else:
-            # If server sends something that is not defined
-            self.log("UNKNOWN SERVER MESSAGE: " + msg)
+        # Lobby mode: ready for the next game right away, Disconnect leaves
+        if self.lobby and self.net is not None:
+            self.net.send(self.ready_message())
+            self.log("READY sent, waiting for the next game...")
 
     # Function to send answers to server
     def submit_answer(self):
@@ -286,20 +267,17 @@ class QuizClient:
             return
 
         ans = self.answer_var.get().strip().upper()
-        if ans not in ["A", "B", "C"]:
+        data = self.answer_message(ans)
+        if data is None:
             self.log("Invalid radio choice.") # (Shouldn't happen, just to be sure)
             return
 
-        try:
-            # Send the answer to the server
-            self.client_socket.sendall(("ANSWER|" + ans).encode())
-            self.log("ANSWER SENT: " + ans)
-
-            # Disable the button immediately after submission
-            self.submit_button.config(state=tk.DISABLED)
-        except (socket.error, OSError):
-            self.log("Failed to send answer (socket error).")
-            self.disconnect()
+        # Queued for the send thread, a failed send arrives later as a "closed" event
+        self.net.send(data)
+        self.log("ANSWER SENT: " + ans)
+
+        # Disable the button immediately after submission
+        self.submit_button.config(state=tk.DISABLED)
 
     # Closing
     def on_closing(self):
@@ -307,6 +285,11 @@ class QuizClient:
             self.disconnect()
         except Exception:
             pass
+        try:
+            self.master.after_cancel(self.poll_id)
+        except (tk.TclError, ValueError):
+            pass
+        self.log_view.stop()
         try:
             self.master.destroy()
         except Exception:
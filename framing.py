@@ -0,0 +1,71 @@
+# FRAMING
+
+# Shared by server_side/quiz_engine and client_side. Every message on the wire is one
+# line terminated by "\n". TCP doesn't keep message boundaries, one recv can hold several
+# messages or half of one, so received bytes go through a FrameBuffer which hands back
+# complete lines only.
+
+RECV_SIZE = 65536 # Bytes asked for per recv
+MAX_FRAME = 65536 # Longest line accepted, protects against a peer that never sends "\n"
+
+
+class FrameTooLong(ValueError):
+    pass
+
+
+# Turns a message into the bytes that go on the wire
+def encode_frame(msg: str) -> bytes:
+    return (msg + "\n").encode()
+
+
+# Receive buffer that splits a byte stream into newline-terminated frames.
+# Bytes are appended to one bytearray and consumed from a read offset, so a burst of
+# thousands of frames is parsed in linear time (no rebuilding of the remaining buffer
+# per line). The consumed prefix is dropped once per feed.
+class FrameBuffer:
+    def __init__(self, max_frame: int = MAX_FRAME):
+        self.max_frame = max_frame
+        self.data = bytearray()
+        self.pos = 0  # Start of the first unconsumed frame
+        self.scan = 0 # Where to continue looking for "\n" (no need to rescan a partial frame)
+
+    # Appends received bytes (bytes, bytearray or memoryview)
+    def feed(self, chunk):
+        if self.pos:
+            del self.data[:self.pos]
+            self.scan -= self.pos
+            self.pos = 0
+        self.data += chunk
+
+    # Returns the next complete frame without its line ending, or None if there is none yet
+    def next_frame(self):
+        end = self.data.find(b"\n", self.scan)
+        if end < 0:
+            self.scan = len(self.data)
+            if self.scan - self.pos > self.max_frame:
+                raise FrameTooLong("Frame longer than " + str(self.max_frame) + " bytes.")
+            return None
+
+        stop = end
+        if stop > self.pos and self.data[stop - 1] == 13: # "\r\n" line ending
+            stop -= 1
+        frame = bytes(self.data[self.pos:stop])
+        self.pos = end + 1
+        self.scan = self.pos
+        return frame
+
+    # Removes and returns whatever is buffered after the consumed frames
+    def take_rest(self) -> bytes:
+        rest = bytes(self.data[self.pos:])
+        self.data.clear()
+        self.pos = 0
+        self.scan = 0
+        return rest
+
+    # Yields every complete frame currently buffered
+    def frames(self):
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return
+            yield frame
@@ -0,0 +1,92 @@
+# HISTOGRAM
+
+# Log-linear histogram of non-negative integers (latencies in microseconds here): values
+# below 8 get a bucket each, above that every power of two is split in 4 buckets, so any
+# value is off by at most 1/8 of itself and a few hundred buckets cover microseconds to
+# days. Recording is a couple of integer operations, no sorting and no list of samples.
+
+SUB_BUCKETS = 4 # Buckets per power of two
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        if value < 2 * SUB_BUCKETS:
+            index = value
+        else:
+            shift = value.bit_length() - 3
+            index = shift * SUB_BUCKETS + (value >> shift)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    # Adds another histogram's samples to this one
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    # Value below which a share p (0..1) of the samples fall, middle of its bucket
+    def percentile(self, p: float):
+        if not self.count:
+            return 0
+        rank = max(1, round(p * self.count))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return min(max((low + high) // 2, self.min), self.max)
+        return self.max
+
+    # (upper bound, count) of every non-empty bucket, for exporting
+    def buckets(self) -> list:
+        return [(bucket_bounds(i)[1], n) for i, n in enumerate(self.counts) if n]
+
+    # "n=12 mean=1.2 s p50=... p90=... p99=... max=..." with values formatted by fmt
+    def summary(self, fmt=str) -> str:
+        if not self.count:
+            return "n=0"
+        return (f"n={self.count} mean={fmt(round(self.mean()))} p50={fmt(self.percentile(0.5))}"
+                f" p90={fmt(self.percentile(0.9))} p99={fmt(self.percentile(0.99))} max={fmt(self.max)}")
+
+
+# Smallest and largest value that land in a bucket
+def bucket_bounds(index: int):
+    if index < 2 * SUB_BUCKETS:
+        return index, index
+    shift = index // SUB_BUCKETS - 1
+    top = index % SUB_BUCKETS + SUB_BUCKETS
+    return top << shift, ((top + 1) << shift) - 1
+
+
+# Microseconds as "850 us", "12.3 ms" or "1.23 s"
+def format_us(us: int) -> str:
+    if us < 1000:
+        return str(us) + " us"
+    if us < 1000000:
+        return f"{us / 1000:.1f} ms"
+    return f"{us / 1000000:.2f} s"
@@ -0,0 +1,217 @@
+# LEADERBOARD
+
+# Scores kept ranked as they change, instead of sorting every player after every question.
+# Players are grouped in buckets by score and a Fenwick tree counts players per score, so:
+#   update a score          O(log S)    (a whole round at once: O(changes) set operations)
+#   rank of a player        O(log S)    (1 + players with a strictly higher score)
+#   rank of every score     O(D)        (one pass over the distinct scores)
+#   top K                   O(K + log S), plus sorting the names of the buckets it reaches
+# where S is the highest score and D the number of distinct scores. A bucket's names are
+# only sorted when it is read and has changed since. Ties share a rank and the next rank
+# skips, like before: 3, 3, 1 points -> #1, #1, #3.
+
+import bisect
+
+
+class Leaderboard:
+    def __init__(self):
+        self.score_of = {}  # name -> score
+        self.buckets = {}   # score -> set of names
+        self.sorted_buckets = {} # score -> sorted list of names, dropped when the bucket changes
+        self.distinct = []  # Scores that have at least one player, ascending
+        self.tree = [0] * 65 # Fenwick tree, index score + 1 counts players with that score
+
+    def __len__(self):
+        return len(self.score_of)
+
+    def __contains__(self, name: str):
+        return name in self.score_of
+
+    def clear(self):
+        self.__init__()
+
+    def score(self, name: str) -> int:
+        return self.score_of.get(name, 0)
+
+    # Adds the player or overwrites their score
+    def set_score(self, name: str, score: int):
+        if name in self.score_of:
+            if self.score_of[name] == score:
+                return
+            self.unlink(name)
+        self.link(name, score)
+
+    def add_points(self, name: str, points: int):
+        self.set_score(name, self.score(name) + points)
+
+    # Applies a whole round of name -> points at once. Players that move between the same
+    # two scores are moved together, so the per-player work is only set and dict operations.
+    def add_points_many(self, points_by_name: dict):
+        moves = {}
+        for name, points in points_by_name.items():
+            old = self.score_of.get(name)
+            if points == 0 and old is not None:
+                continue
+            new = (old or 0) + points
+            group = moves.get((old, new))
+            if group is None:
+                moves[(old, new)] = [name]
+            else:
+                group.append(name)
+
+        touched = set()
+        for (old, new), names in moves.items():
+            if old is not None:
+                self.buckets[old].difference_update(names)
+                self.tree_add(old, -len(names))
+                touched.add(old)
+            self.tree_add(new, len(names))
+            bucket = self.buckets.get(new)
+            if bucket is None:
+                bucket = self.buckets[new] = set()
+                bisect.insort(self.distinct, new)
+            bucket.update(names)
+            self.score_of.update(dict.fromkeys(names, new))
+            touched.add(new)
+
+        for score in touched:
+            self.sorted_buckets.pop(score, None)
+            if not self.buckets[score]:
+                del self.buckets[score]
+                del self.distinct[bisect.bisect_left(self.distinct, score)]
+
+    def remove(self, name: str):
+        if name in self.score_of:
+            self.unlink(name)
+
+    # Players with a strictly higher score, plus one
+    def rank(self, name: str) -> int:
+        return len(self.score_of) - self.count_at_most(self.score_of[name]) + 1
+
+    # score -> rank for every score somebody has, for ranking a whole room at once
+    def rank_table(self) -> dict:
+        table = {}
+        rank = 1
+        for i in range(len(self.distinct) - 1, -1, -1):
+            score = self.distinct[i]
+            table[score] = rank
+            rank += len(self.buckets[score])
+        return table
+
+    # Names that share this player's score (including them), sorted
+    def tie_group(self, name: str) -> list:
+        return list(self.bucket_names(self.score_of[name]))
+
+    # The highest score and the players that have it
+    def leaders(self):
+        if not self.distinct:
+            return None, []
+        top = self.distinct[-1]
+        return top, list(self.bucket_names(top))
+
+    # Yields (rank, name, score) from first place down, ties sorted by name
+    def ranked(self):
+        rank = 1
+        for i in range(len(self.distinct) - 1, -1, -1):
+            score = self.distinct[i]
+            names = self.bucket_names(score)
+            for name in names:
+                yield rank, name, score
+            rank += len(names)
+
+    # First k entries of ranked()
+    def top(self, k: int) -> list:
+        result = []
+        for entry in self.ranked():
+            if len(result) >= k:
+                break
+            result.append(entry)
+        return result
+
+    # The entries directly above and below a player: (above or None, below or None)
+    def neighbours(self, name: str):
+        score = self.score_of[name]
+        names = self.bucket_names(score)
+        pos = bisect.bisect_left(names, name)
+        rank = self.rank(name)
+
+        if pos > 0:
+            above = (rank, names[pos - 1], score)
+        else:
+            i = bisect.bisect_right(self.distinct, score)
+            if i < len(self.distinct):
+                above_score = self.distinct[i]
+                above_names = self.bucket_names(above_score)
+                above = (rank - len(above_names), above_names[-1], above_score)
+            else:
+                above = None
+
+        if pos + 1 < len(names):
+            below = (rank, names[pos + 1], score)
+        else:
+            i = bisect.bisect_left(self.distinct, score)
+            if i > 0:
+                below_score = self.distinct[i - 1]
+                below = (rank + len(names), self.bucket_names(below_score)[0], below_score)
+            else:
+                below = None
+
+        return above, below
+
+    # Sorted names of one bucket, sorted again only if it changed since the last call
+    def bucket_names(self, score: int) -> list:
+        names = self.sorted_buckets.get(score)
+        if names is None:
+            names = self.sorted_buckets[score] = sorted(self.buckets[score])
+        return names
+
+    def link(self, name: str, score: int):
+        self.tree_add(score, 1) # First, a grow() rebuilds the tree from the buckets
+        self.score_of[name] = score
+        bucket = self.buckets.get(score)
+        if bucket is None:
+            bucket = self.buckets[score] = set()
+            bisect.insort(self.distinct, score)
+        bucket.add(name)
+        self.sorted_buckets.pop(score, None)
+
+    def unlink(self, name: str):
+        score = self.score_of.pop(name)
+        bucket = self.buckets[score]
+        bucket.discard(name)
+        self.sorted_buckets.pop(score, None)
+        if not bucket:
+            del self.buckets[score]
+            del self.distinct[bisect.bisect_left(self.distinct, score)]
+        self.tree_add(score, -1)
+
+    def tree_add(self, score: int, delta: int):
+        if score < 0:
+            raise ValueError("Scores can't be negative.")
+        if score + 1 >= len(self.tree):
+            self.grow(score + 1)
+        i = score + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    # Players with a score <= score
+    def count_at_most(self, score: int) -> int:
+        i = min(score + 1, len(self.tree) - 1)
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    # Rebuilds the Fenwick tree big enough for index, doubling so this happens rarely
+    def grow(self, index: int):
+        size = len(self.tree) - 1
+        while size <= index:
+            size *= 2
+        self.tree = [0] * (size + 1)
+        for score, bucket in self.buckets.items():
+            i = score + 1
+            while i <= size:
+                self.tree[i] += len(bucket)
+                i += i & -i
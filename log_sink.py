@@ -0,0 +1,219 @@
+# LOG SINK
+
+# Activity log shared by the server and the client. Any thread (event loop, receive
+# thread, Tk) calls LogSink.log, which only appends to a deque (thread-safe, no lock).
+# The lines are then consumed in batches: by the Tk main loop through TkLogView, or by a
+# writer thread that appends them to a file / stdout in headless mode. Memory stays
+# bounded: the window keeps a fixed number of lines and spills older ones to disk.
+
+import collections
+import itertools
+import os
+import threading
+
+try:
+    import tkinter as tk
+    import tkinter.font as tkfont
+except ImportError:
+    tk = None # Headless installs may not have Tk, only TkLogView needs it
+
+MAX_PENDING = 100000 # Lines kept while nobody drains, oldest are dropped after that
+
+
+class LogSink:
+    def __init__(self, max_pending: int = MAX_PENDING):
+        self.pending = collections.deque(maxlen=max_pending)
+        self.writer_thread = None
+        self.stop_event = threading.Event()
+
+    # Safe to call from any thread
+    def log(self, msg: str):
+        self.pending.append(msg)
+
+    # Takes up to max_lines queued lines (all of them if None)
+    def drain(self, max_lines=None) -> list:
+        lines = []
+        pending = self.pending
+        while pending and (max_lines is None or len(lines) < max_lines):
+            try:
+                lines.append(pending.popleft())
+            except IndexError:
+                break
+        return lines
+
+    # Headless mode: a background thread writes the queued lines to stream every interval seconds
+    def start_writer(self, stream, interval: float = 0.1):
+        def run():
+            while not self.stop_event.wait(interval):
+                self.write_to(stream)
+            self.write_to(stream)
+
+        self.writer_thread = threading.Thread(target=run, daemon=True)
+        self.writer_thread.start()
+
+    def write_to(self, stream):
+        lines = self.drain()
+        if lines:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+
+    # Stops the writer thread after it wrote everything still queued
+    def close(self):
+        if self.writer_thread is not None:
+            self.stop_event.set()
+            self.writer_thread.join()
+            self.writer_thread = None
+
+
+# Appends lines to a file and rotates it once it passes max_bytes:
+# path -> path.1 -> path.2 ... up to backups files, the oldest is deleted.
+class RotatingLogFile:
+    def __init__(self, path: str, max_bytes: int = 5 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = None # Opened on the first write, so nothing is created if nothing spills
+
+    def write(self, text: str):
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write(text)
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path + "." + str(i)
+            if os.path.exists(older):
+                os.replace(older, self.path + "." + str(i + 1))
+        if self.backups > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self.file = None
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# The newest max_lines log lines in a ring buffer. Lines pushed out of it go to the
+# spill file (if there is one), so memory stays constant however long the program runs.
+class LogHistory:
+    def __init__(self, max_lines: int = 10000, spill=None):
+        self.lines = collections.deque(maxlen=max_lines)
+        self.spill = spill # RotatingLogFile or None to just drop old lines
+
+    def __len__(self):
+        return len(self.lines)
+
+    def extend(self, new_lines):
+        overflow = len(self.lines) + len(new_lines) - self.lines.maxlen
+        if overflow > 0 and self.spill is not None:
+            evicted = list(itertools.islice(self.lines, min(overflow, len(self.lines))))
+            evicted += new_lines[:overflow - len(evicted)] # Burst bigger than the whole buffer
+            self.spill.write("\n".join(evicted) + "\n")
+            self.spill.flush()
+        self.lines.extend(new_lines)
+
+    # Lines [first, first + count)
+    def window(self, first: int, count: int) -> list:
+        return list(itertools.islice(self.lines, first, first + count))
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+
+
+# Shows a LogSink in a Listbox without putting the whole history into it. The Tk main loop
+# polls the sink with after() and moves new lines into a LogHistory; the Listbox only ever
+# holds the rows that fit on screen, and the scrollbar / mouse wheel move that window over
+# the history. While scrolled to the bottom the view follows new lines.
+class TkLogView:
+    def __init__(self, master, listbox, scrollbar, sink: LogSink, history: LogHistory,
+                 interval_ms: int = 50, batch: int = 2000):
+        self.master = master
+        self.listbox = listbox
+        self.scrollbar = scrollbar
+        self.sink = sink
+        self.history = history
+        self.interval_ms = interval_ms
+        self.batch = batch # Lines per poll, so one huge burst can't freeze the window
+
+        self.first = 0 # History index of the top visible row
+        self.follow = True # Stick to the newest line
+        self.rows = max(1, int(listbox.cget("height")))
+        self.line_height = tkfont.Font(font=listbox.cget("font")).metrics("linespace") + 1
+
+        self.scrollbar.config(command=self.on_scrollbar)
+        self.listbox.bind("<Configure>", self.on_resize)
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll_by(-1 if e.delta > 0 else 1, 3))
+        self.listbox.bind("<Button-4>", lambda e: self.scroll_by(-1, 3))
+        self.listbox.bind("<Button-5>", lambda e: self.scroll_by(1, 3))
+
+        self.after_id = self.master.after(self.interval_ms, self.poll)
+
+    def poll(self):
+        lines = self.sink.drain(self.batch)
+        if lines:
+            total_before = len(self.history)
+            self.history.extend(lines)
+            if not self.follow:
+                # Keep the same lines on screen when old ones are pushed out of the buffer
+                shift = total_before + len(lines) - len(self.history)
+                self.first = max(0, self.first - shift)
+            self.refresh()
+        # Come back right away if a burst is still queued
+        delay = 1 if self.sink.pending else self.interval_ms
+        self.after_id = self.master.after(delay, self.poll)
+
+    # Materializes only the visible window of the history
+    def refresh(self):
+        total = len(self.history)
+        last_first = max(0, total - self.rows)
+        if self.follow or self.first > last_first:
+            self.first = last_first
+        self.listbox.delete(0, tk.END)
+        visible = self.history.window(self.first, self.rows)
+        if visible:
+            self.listbox.insert(tk.END, *visible)
+        if total:
+            self.scrollbar.set(self.first / total, (self.first + len(visible)) / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_to(self, first: int):
+        last_first = max(0, len(self.history) - self.rows)
+        self.first = min(max(0, first), last_first)
+        self.follow = self.first >= last_first
+        self.refresh()
+
+    def scroll_by(self, direction: int, rows: int):
+        self.scroll_to(self.first + direction * rows)
+
+    # Scrollbar callback: ("moveto", fraction) or ("scroll", n, "units"/"pages")
+    def on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.scroll_to(int(float(args[0]) * len(self.history)))
+        elif action == "scroll":
+            step = self.rows if args[1] == "pages" else 1
+            self.scroll_by(int(args[0]), step)
+
+    def on_resize(self, event):
+        rows = max(1, event.height // self.line_height)
+        if rows != self.rows:
+            self.rows = rows
+            self.refresh()
+
+    def stop(self):
+        try:
+            self.master.after_cancel(self.after_id)
+        except (tk.TclError, ValueError):
+            pass
+        self.history.close()
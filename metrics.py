@@ -0,0 +1,136 @@
+# METRICS
+
+# Counters, gauges and histograms of a running server, off unless --metrics-port or
+# --metrics-dump is given. The engine keeps metrics = None when they are off and every place
+# that records checks that first, so a server without metrics pays one comparison per event.
+#   counters   - only go up (messages_in, bytes_out...)
+#   gauges     - functions read when the metrics are collected (connected_clients...), so
+#                keeping them current costs nothing
+#   histograms - histogram.Histogram of microseconds (handshake_time_us, round_duration_us...)
+# They can be read two ways, both local:
+#   --metrics-port 9100   GET http://127.0.0.1:9100/metrics (text, one "name value" per line,
+#                         the Prometheus text format) or /metrics.json
+#   --metrics-dump FILE   the JSON snapshot written to FILE every --metrics-interval seconds
+# Loop lag (how late a timer fires) is sampled in the background: with everything on one
+# event loop that is the time any message waits before it is handled.
+
+import asyncio
+import collections
+import json
+import os
+import time
+
+from histogram import Histogram
+
+QUANTILES = (0.5, 0.9, 0.99)
+LAG_INTERVAL = 0.1 # Seconds between loop lag samples
+MAX_REQUEST = 8192
+
+
+class Metrics:
+    def __init__(self, prefix: str = "quiz_"):
+        self.prefix = prefix
+        self.started = time.time()
+        self.counters = collections.defaultdict(int)
+        self.gauges = {} # Name -> function returning the current value
+        self.histograms = collections.defaultdict(Histogram)
+        self.tasks = []
+        self.server = None
+
+    def inc(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def gauge(self, name: str, read):
+        self.gauges[name] = read
+
+    def observe(self, name: str, value: int):
+        self.histograms[name].record(value)
+
+    def snapshot(self) -> dict:
+        histograms = {}
+        for name, h in self.histograms.items():
+            histograms[name] = {"count": h.count, "sum": h.total, "min": h.min or 0, "max": h.max,
+                                "quantiles": {str(q): h.percentile(q) for q in QUANTILES},
+                                "buckets": h.buckets()}
+        return {"time": time.time(), "uptime": time.time() - self.started,
+                "counters": dict(self.counters),
+                "gauges": {name: read() for name, read in self.gauges.items()},
+                "histograms": histograms}
+
+    # Prometheus text format
+    def render_text(self) -> str:
+        lines = []
+        for name in sorted(self.counters):
+            lines.append(f"# TYPE {self.prefix}{name} counter")
+            lines.append(f"{self.prefix}{name} {self.counters[name]}")
+        for name in sorted(self.gauges):
+            lines.append(f"# TYPE {self.prefix}{name} gauge")
+            lines.append(f"{self.prefix}{name} {self.gauges[name]()}")
+        for name in sorted(self.histograms):
+            h = self.histograms[name]
+            lines.append(f"# TYPE {self.prefix}{name} summary")
+            for q in QUANTILES:
+                lines.append(f'{self.prefix}{name}{{quantile="{q}"}} {h.percentile(q)}')
+            lines.append(f"{self.prefix}{name}_sum {h.total}")
+            lines.append(f"{self.prefix}{name}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+    # Starts the endpoint / dump and the loop lag sampler on the running loop
+    async def start(self, port: int = 0, dump_path: str = "", interval: float = 10.0, host: str = "127.0.0.1"):
+        loop = asyncio.get_running_loop()
+        if port:
+            self.server = await asyncio.start_server(self.handle_request, host, port)
+        if dump_path:
+            self.tasks.append(loop.create_task(self.dump_loop(dump_path, interval)))
+        self.tasks.append(loop.create_task(self.lag_loop()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def lag_loop(self):
+        while True:
+            start = time.monotonic_ns()
+            await asyncio.sleep(LAG_INTERVAL)
+            late = time.monotonic_ns() - start - int(LAG_INTERVAL * 1e9)
+            self.observe("loop_lag_us", max(0, late) // 1000)
+
+    # Writes the snapshot to a temporary file and renames it, readers never see half a file
+    async def dump_loop(self, path: str, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.dump(path)
+
+    def dump(self, path: str):
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+
+    # Just enough HTTP for curl and a Prometheus scraper: GET /metrics or /metrics.json
+    async def handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+            parts = request[:MAX_REQUEST].split(b" ")
+            path = parts[1].decode(errors="replace") if len(parts) > 1 else ""
+            if path == "/metrics.json":
+                status, ctype, body = "200 OK", "application/json", json.dumps(self.snapshot())
+            elif path in ("/", "/metrics"):
+                status, ctype, body = "200 OK", "text/plain; version=0.0.4", self.render_text()
+            else:
+                status, ctype, body = "404 Not Found", "text/plain", "Not found\n"
+            data = body.encode()
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(data)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + data)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,106 @@
+# PLAYER TABLE
+
+# The players of a room. Each one gets a small integer id when it joins, and the per-round
+# state lives in arrays indexed by that id instead of dicts keyed by name. The answers to the
+# current question are a bytearray and their latencies an int64 array. Scoring a round walks
+# those arrays in id order, and clearing them for the next question is one allocation each.
+# Ids of players that left are given to later joins.
+# order is the answer log of the round: the ids of the players that answered, in the order
+# the answers were taken. An answer's position in it is its sequence number. Taking an answer
+# writes two array slots and appends one id, and nothing else happens per answer (see
+# Room.process_answer).
+# For lookups it reads like a dict of name -> ClientConnection (len, in, get, items...), which
+# is how the engine finds players. Scores stay in the room's Leaderboard, which keeps them
+# ranked.
+
+import array
+
+ANSWERS = "ABC" # Answer codes in the answers array: 0 no answer, 1 + index in ANSWERS
+
+
+class PlayerTable:
+    def __init__(self):
+        self.names = [] # Id -> name (for a free id, of the last player that had it)
+        self.clients = [] # Id -> ClientConnection, None for a free id
+        self.ids = {} # Name -> id
+        self.free = [] # Ids to give out again
+        self.answers = bytearray() # Id -> answer code for the current question
+        self.latency = array.array("q") # Id -> nanoseconds from the question broadcast to the answer
+        self.order = array.array("i") # Ids in the order their answers were taken
+        self.answered = 0 # Answers to the current question by players still here
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, name) -> bool:
+        return name in self.ids
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __getitem__(self, name: str):
+        return self.clients[self.ids[name]]
+
+    def get(self, name: str, default=None):
+        pid = self.ids.get(name)
+        return default if pid is None else self.clients[pid]
+
+    def keys(self):
+        return self.ids.keys()
+
+    def values(self):
+        return [self.clients[pid] for pid in self.ids.values()]
+
+    def items(self):
+        return [(name, self.clients[pid]) for name, pid in self.ids.items()]
+
+    # Adds a player, returns its id
+    def add(self, name: str, client) -> int:
+        if self.free:
+            pid = self.free.pop()
+            self.names[pid] = name
+            self.clients[pid] = client
+            self.answers[pid] = 0
+            self.latency[pid] = 0
+        else:
+            pid = len(self.names)
+            self.names.append(name)
+            self.clients.append(client)
+            self.answers.append(0)
+            self.latency.append(0)
+        self.ids[name] = pid
+        return pid
+
+    # Removes a player. Its answer stays in the answer log but no longer counts in answered,
+    # so the round waits for the players who are left.
+    def remove(self, name: str):
+        pid = self.ids.pop(name)
+        client = self.clients[pid]
+        self.clients[pid] = None
+        if self.answers[pid]:
+            self.answered -= 1
+        self.free.append(pid)
+        return client
+
+    # New question: nobody has answered
+    def clear_answers(self):
+        size = len(self.names)
+        self.answers = bytearray(size)
+        self.latency = array.array("q", bytes(8 * size))
+        self.order = array.array("i")
+        self.answered = 0
+
+    # Records the answer ("A", "B" or "C") of a player, False if it already answered
+    def set_answer(self, pid: int, ans: str, latency: int) -> bool:
+        if self.answers[pid]:
+            return False
+        self.answers[pid] = ANSWERS.index(ans) + 1
+        self.latency[pid] = latency
+        self.order.append(pid)
+        self.answered += 1
+        return True
+
+    # The answer of a player to the current question, None if it has not answered
+    def answer(self, name: str):
+        code = self.answers[self.ids[name]]
+        return ANSWERS[code - 1] if code else None
@@ -0,0 +1,237 @@
+# PROTOCOL
+
+# The two wire formats a connection can use. Both sides build messages as a type and a list
+# of fields, e.g. ("QUESTION", text, a, b, c, idx, total), and let the codec turn them into
+# bytes; received bytes are fed to the codec's decoder which yields [type, field, ...] lists
+# of strings, the same shape the text protocol always had after split("|").
+#
+# text   - TYPE|field|field\n, newlines inside fields are sent as "\n" (backslash n).
+#          The default, and what every older client speaks.
+# binary - 5 byte header (type byte, payload length as uint32) followed by struct packed
+#          fields: integers as uint32, strings length-prefixed UTF-8. Questions the client
+#          has already seen are sent as a QREF (question id only) instead of the full text.
+#
+# The client picks the format in the handshake: its first line is the name, optionally
+# followed by "|binary" (names can't contain "|"). Everything after that line uses the
+# chosen format in both directions. The handshake can also carry "|room=NAME" to join a
+# named room (game) instead of the default one, e.g. "alice|binary|room=finals".
+
+import struct
+
+from framing import FrameBuffer, MAX_FRAME, encode_frame
+
+HEADER = struct.Struct("!BI")
+U16 = struct.Struct("!H")
+U32 = struct.Struct("!I")
+MAX_SHORT_STRING = 0xFFFF # Bytes an "s" field can hold, longer strings are cut
+
+# Field layouts for the binary format:
+#   I uint32, s string with uint16 length (longer ones are cut), S string with uint32 length, c one ASCII character
+BINARY_TYPES = {
+    "ERROR": (1, "s"),
+    "MSG": (2, "s"),
+    "QUESTION": (3, "ssssIII"), # text, A, B, C, idx, total, question id
+    "QREF": (4, "III"),         # question id, idx, total (client already has the text)
+    "YOURRESULT": (5, "s"),
+    "SCORE": (6, "S"),
+    "GAMEOVER": (7, "S"),
+    "MYRANK": (8, "IIIsIsI"),   # rank, score, players, above, above score, below, below score
+    "ANSWER": (9, "c"),
+    "READY": (10, ""),         # lobby client wants to play the next game
+}
+BINARY_TYPES_BY_ID = {type_id: (mtype, spec) for mtype, (type_id, spec) in BINARY_TYPES.items()}
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+# Splits the handshake line into the name, the requested codec name, the room name ("" when
+# the client didn't ask for one) and whether the client stays connected between games
+# ("lobby": it sends READY| for the next game instead of disconnecting after GAMEOVER|)
+def parse_handshake(line: str):
+    name, *options = line.split("|")
+    codec = "text"
+    room = ""
+    lobby = False
+    for option in options:
+        option = option.strip()
+        if option.lower() == "binary":
+            codec = "binary"
+        elif option.startswith("room="):
+            room = option[5:].strip()
+        elif option.lower() == "lobby":
+            lobby = True
+    return name.strip(), codec, room, lobby
+
+
+def make_handshake(name: str, codec: str, room: str = "", lobby: bool = False) -> bytes:
+    line = name
+    if codec == "binary":
+        line += "|binary"
+    if room:
+        line += "|room=" + room
+    if lobby:
+        line += "|lobby"
+    return encode_frame(line)
+
+
+class TextCodec:
+    name = "text"
+
+    def encode(self, mtype: str, *fields) -> bytes:
+        parts = [mtype]
+        for field in fields:
+            parts.append(str(field).replace("\n", "\\n"))
+        return encode_frame("|".join(parts))
+
+    def decoder(self, max_frame: int = MAX_FRAME):
+        return TextDecoder(max_frame)
+
+
+class TextDecoder:
+    def __init__(self, max_frame: int = MAX_FRAME):
+        self.frames = FrameBuffer(max_frame)
+
+    def feed(self, chunk):
+        self.frames.feed(chunk)
+
+    def messages(self):
+        for frame in self.frames.frames():
+            line = frame.decode(errors="replace").strip()
+            if line:
+                yield line.split("|")
+
+
+# Cuts UTF-8 data to at most limit bytes without splitting a character
+def cut_utf8(data: bytes, limit: int) -> bytes:
+    return data[:limit].decode(errors="ignore").encode()
+
+
+# Builds the encode function of one message type. Messages made of a single string (most of
+# them: MSG, YOURRESULT, SCORE...) are packed with one struct call.
+def binary_encoder(type_id: int, spec: str):
+    if spec in ("s", "S"):
+        head = struct.Struct("!BI" + ("H" if spec == "s" else "I"))
+        extra = head.size - HEADER.size
+        limit = MAX_SHORT_STRING if spec == "s" else 0xFFFFFFFF - extra
+
+        def encode_string(value):
+            data = value.encode() if isinstance(value, str) else str(value).encode()
+            if len(data) > limit:
+                data = cut_utf8(data, limit)
+            return head.pack(type_id, len(data) + extra, len(data)) + data
+        return encode_string
+
+    def encode_fields(*fields):
+        pieces = [b""]
+        size = 0
+        for kind, value in zip(spec, fields):
+            if kind == "I":
+                piece = U32.pack(value if value.__class__ is int else int(value or 0))
+            elif kind == "c":
+                piece = str(value).encode()[:1] or b"?"
+            else:
+                data = value.encode() if isinstance(value, str) else str(value).encode()
+                if kind == "s":
+                    if len(data) > MAX_SHORT_STRING:
+                        data = cut_utf8(data, MAX_SHORT_STRING)
+                    piece = U16.pack(len(data)) + data
+                else:
+                    piece = U32.pack(len(data)) + data
+            pieces.append(piece)
+            size += len(piece)
+        pieces[0] = HEADER.pack(type_id, size)
+        return b"".join(pieces)
+    return encode_fields
+
+
+class BinaryCodec:
+    name = "binary"
+
+    def __init__(self):
+        self.encoders = {mtype: binary_encoder(type_id, spec) for mtype, (type_id, spec) in BINARY_TYPES.items()}
+
+    def encode(self, mtype: str, *fields) -> bytes:
+        return self.encoders[mtype](*fields)
+
+    def decoder(self, max_frame: int = MAX_FRAME):
+        return BinaryDecoder(max_frame)
+
+
+# Same buffering idea as FrameBuffer (one bytearray, read offset, compact once per feed),
+# with length-prefixed frames instead of lines
+class BinaryDecoder:
+    def __init__(self, max_frame: int = MAX_FRAME):
+        self.max_frame = max_frame
+        self.data = bytearray()
+        self.pos = 0
+        self.questions = {} # Question id -> [text, A, B, C], to resolve QREF messages
+
+    def feed(self, chunk):
+        if self.pos:
+            del self.data[:self.pos]
+            self.pos = 0
+        self.data += chunk
+
+    def messages(self):
+        data = self.data
+        while len(data) - self.pos >= HEADER.size:
+            type_id, length = HEADER.unpack_from(data, self.pos)
+            if length > self.max_frame:
+                raise ProtocolError("Frame longer than " + str(self.max_frame) + " bytes.")
+            start = self.pos + HEADER.size
+            end = start + length
+            if end > len(data):
+                return
+            self.pos = end
+            yield self.decode(type_id, start, end)
+
+    # Decodes the payload at data[start:end]
+    def decode(self, type_id: int, start: int, end: int) -> list:
+        if type_id not in BINARY_TYPES_BY_ID:
+            raise ProtocolError("Unknown message type " + str(type_id) + ".")
+        mtype, spec = BINARY_TYPES_BY_ID[type_id]
+        data = self.data
+        if spec == "s": # Single string messages skip the field loop
+            return [mtype, data[start + 2:end].decode(errors="replace")]
+        if spec == "S":
+            return [mtype, data[start + 4:end].decode(errors="replace")]
+        parts = [mtype]
+        offset = start
+        try:
+            for kind in spec:
+                if kind == "I":
+                    parts.append(str(U32.unpack_from(data, offset)[0]))
+                    offset += 4
+                elif kind == "c":
+                    parts.append(data[offset:offset + 1].decode(errors="replace"))
+                    offset += 1
+                else:
+                    size = U16 if kind == "s" else U32
+                    length = size.unpack_from(data, offset)[0]
+                    offset += size.size
+                    parts.append(data[offset:offset + length].decode(errors="replace"))
+                    offset += length
+        except struct.error:
+            raise ProtocolError("Truncated " + mtype + " message.")
+        if offset > end:
+            raise ProtocolError("Truncated " + mtype + " message.")
+
+        # Give callers the same fields the text protocol has
+        if mtype == "QUESTION":
+            self.questions[parts[7]] = parts[1:5]
+            return parts[:7]
+        if mtype == "QREF":
+            question = self.questions.get(parts[1])
+            if question is None:
+                raise ProtocolError("Reference to unknown question " + parts[1] + ".")
+            return ["QUESTION"] + question + parts[2:4]
+        if mtype == "MYRANK":
+            for i in (4, 6): # Empty neighbour name means there is none
+                if not parts[i]:
+                    parts[i + 1] = ""
+        return parts
+
+
+CODECS = {"text": TextCodec(), "binary": BinaryCodec()}
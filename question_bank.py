@@ -0,0 +1,515 @@
+# QUESTION BANK
+
+# Question files are compiled once to a binary cache next to them ("questions.txt.qbank") and
+# the cache is memory-mapped, so loading a bank of hundreds of thousands of questions is
+# opening a file, not parsing it, and only the questions a game actually asks are decoded.
+#
+# Cache layout (big endian):
+#   header   magic, format version, question count, source size, source mtime (ns),
+#            BLAKE2b digest of the source, where the offsets table and the groups start
+#   records  difficulty as uint32, then question, choice A, B, C, answer, category; each a
+#            uint32 length and UTF-8 bytes
+#   offsets  one uint64 per question, where its record starts
+#   groups   uint32 group count, then per (category, difficulty) group: difficulty, question
+#            count, position of its ids, category (uint16 length and UTF-8); then the ids of
+#            every group as uint32 arrays
+# The offsets and groups come last so the file can be written in one pass while the source is
+# parsed. The groups let a game draw from "science questions of difficulty 2-3" without
+# looking at any other question.
+#
+# The cache is used when the source's size and mtime match the header. If only the mtime
+# changed (file touched or copied), the source is hashed and a matching digest keeps the
+# cache. Anything else recompiles it. The header and offsets table are checked once when the
+# cache is opened, not on every question.
+
+import array
+import bisect
+import codecs
+import hashlib
+import io
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+MAGIC = b"QBANK\x00\x00\x01"
+VERSION = 3
+HEADER = struct.Struct("!8sIIQq16sQQ") # magic, version, count, source size, source mtime_ns, digest,
+                                       # offsets position, groups position
+OFFSET = struct.Struct("!Q")
+LENGTH = struct.Struct("!I")
+GROUP = struct.Struct("!IIQH") # difficulty, count, ids position, category length
+CACHE_SUFFIX = ".qbank"
+CHUNK = 1024 * 1024 # Bytes read from the question file at a time
+
+
+class BankError(ValueError):
+    pass
+
+
+# One question as a game uses it. Slots instead of a dict take about a third of the memory,
+# and category names (a handful per bank) are interned so the questions of a category share
+# one string. answer is one of the one-character strings "A", "B", "C", which CPython keeps
+# as single shared objects, so it costs a pointer.
+class Question:
+    __slots__ = ("id", "text", "choices", "answer", "category", "difficulty")
+
+    def __init__(self, id: int, text: str, choices: tuple, answer: str, category: str = "", difficulty: int = 0):
+        self.id = id
+        self.text = text
+        self.choices = choices # (A, B, C)
+        self.answer = answer
+        self.category = category
+        self.difficulty = difficulty
+
+    def __repr__(self):
+        return f"Question({self.id}, {self.text!r}, answer={self.answer!r})"
+
+
+# Read-only view of a compiled bank, indexable like a list of Question records
+class QuestionBank:
+    def __init__(self, data, source: str = "", mapped=None):
+        self.data = data # mmap or bytes of the whole cache file
+        self.source = source
+        self.mapped = mapped # Kept to close it
+        self.version = 0 # Set by the engine when it installs the bank
+        magic, version, count, _, _, _, offsets_at, groups_at = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise BankError("Not a question bank cache (or an old format).")
+        if offsets_at + count * OFFSET.size != groups_at or groups_at + LENGTH.size > len(data):
+            raise BankError("Question bank cache is truncated.")
+        if count and not HEADER.size <= OFFSET.unpack_from(data, offsets_at + (count - 1) * OFFSET.size)[0] < offsets_at:
+            raise BankError("Question bank cache is damaged.")
+        self.count = count
+        self.offsets_at = offsets_at
+
+        # (category, difficulty, count, ids position), a few entries even for huge banks
+        self.groups = []
+        pos = groups_at + LENGTH.size
+        for _ in range(LENGTH.unpack_from(data, groups_at)[0]):
+            difficulty, size, ids_at, name_length = GROUP.unpack_from(data, pos)
+            pos += GROUP.size
+            category = data[pos:pos + name_length].decode(errors="replace")
+            pos += name_length
+            if ids_at + size * LENGTH.size > len(data):
+                raise BankError("Question bank cache is truncated.")
+            self.groups.append((category, difficulty, size, ids_at))
+
+    def __len__(self):
+        return self.count
+
+    # Decodes one question from the cache
+    def __getitem__(self, index: int) -> Question:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("question index out of range")
+        pos = OFFSET.unpack_from(self.data, self.offsets_at + index * OFFSET.size)[0]
+        difficulty = LENGTH.unpack_from(self.data, pos)[0]
+        pos += LENGTH.size
+        fields = []
+        for _ in range(6):
+            length = LENGTH.unpack_from(self.data, pos)[0]
+            pos += LENGTH.size
+            fields.append(self.data[pos:pos + length].decode(errors="replace"))
+            pos += length
+        answer = fields[4].strip().upper()[:1]
+        return Question(index, fields[0], (fields[1], fields[2], fields[3]), answer, sys.intern(fields[5]), difficulty)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    # Categories present in the bank ("" for untagged questions)
+    def categories(self) -> list:
+        return sorted(set(group[0] for group in self.groups))
+
+    # The questions matching the filters as a Selection, without touching any question.
+    # categories is a collection of names (None: all), difficulties are inclusive bounds.
+    def select(self, categories=None, min_difficulty=None, max_difficulty=None):
+        if categories is None and min_difficulty is None and max_difficulty is None:
+            return Selection(self, None)
+        wanted = None if categories is None else set(c.lower() for c in categories)
+        groups = []
+        for (category, difficulty, size, ids_at) in self.groups:
+            if wanted is not None and category.lower() not in wanted:
+                continue
+            if min_difficulty is not None and difficulty < min_difficulty:
+                continue
+            if max_difficulty is not None and difficulty > max_difficulty:
+                continue
+            groups.append((size, ids_at))
+        return Selection(self, groups)
+
+    # Draws k different questions (all of them if there are fewer) in random order, see
+    # Selection.sample. Returns the Question records.
+    def sample(self, k: int, rng=random, categories=None, min_difficulty=None, max_difficulty=None) -> list:
+        selection = self.select(categories, min_difficulty, max_difficulty)
+        return [self[i] for i in selection.sample(k, rng)]
+
+    def close(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+
+# Question ids matching a filter: a concatenation of group id arrays, indexed through their
+# running totals, or every id of the bank when groups is None
+class Selection:
+    def __init__(self, bank: QuestionBank, groups):
+        self.bank = bank
+        self.groups = groups
+        self.starts = [] # Index of the first question of each group
+        total = 0
+        for (size, _) in groups or []:
+            self.starts.append(total)
+            total += size
+        self.total = bank.count if groups is None else total
+
+    def __len__(self):
+        return self.total
+
+    # Question id of the index-th matching question
+    def __getitem__(self, index: int) -> int:
+        if self.groups is None:
+            return index
+        g = bisect.bisect_right(self.starts, index) - 1
+        return LENGTH.unpack_from(self.bank.data, self.groups[g][1] + (index - self.starts[g]) * LENGTH.size)[0]
+
+    # k distinct question ids in random order. Floyd's algorithm picks k of n indexes in O(k)
+    # steps whatever n is, so a 10 question game on a million question bank costs 10 draws.
+    # Pass random.Random(seed) as rng for a reproducible draw.
+    def sample(self, k: int, rng=random) -> list:
+        n = self.total
+        k = min(k, n)
+        chosen = set()
+        for j in range(n - k, n):
+            t = rng.randrange(j + 1)
+            chosen.add(j if t in chosen else t)
+        picked = sorted(chosen) # Sets iterate in hash order, sort so a seed always gives the same order
+        rng.shuffle(picked)
+        return [self[i] for i in picked]
+
+
+# Counters of one parse, for the load log and the benchmark
+class ParseStats:
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.questions = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def summary(self) -> str:
+        rate = self.lines / self.seconds if self.seconds else 0.0
+        mb_rate = self.bytes / self.seconds / 1e6 if self.seconds else 0.0
+        return (f"{self.lines} lines, {self.questions} questions, {self.errors} malformed in {self.seconds:.2f}s"
+                f" ({rate:,.0f} lines/s, {mb_rate:.1f} MB/s)")
+
+
+# Streams questions out of a question file opened in binary mode, in chunks of CHUNK bytes, so
+# memory doesn't grow with the file. Questions are 5 lines (question, three choices, answer),
+# separated by blank lines or not, each optionally preceded by a tag line like
+# "[category=Science, difficulty=2]". A malformed question is reported to on_error(line
+# number, message) and skipped, the next one starts fresh instead of shifting every following
+# question (see block_questions).
+# Yields (question, A, B, C, answer, category, difficulty).
+def parse_questions(f, on_error=None, stats=None, digest=None):
+    stats = stats if stats is not None else ParseStats()
+    on_error = on_error or (lambda lineno, msg: None)
+    block = [] # (line number, text) of the current block
+    broken = False # Current block had an undecodable line
+    lineno = 0
+    tail = b""
+    first = True
+    while True:
+        chunk = f.read(CHUNK)
+        if chunk:
+            stats.bytes += len(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            if first and chunk.startswith(codecs.BOM_UTF8):
+                chunk = chunk[len(codecs.BOM_UTF8):]
+            first = False
+            data = tail + chunk
+            cut = data.rfind(b"\n") + 1
+            tail = data[cut:]
+            data = data[:cut]
+        else: # End of file, the last line may have no "\n"
+            data = tail + b"\n" if tail else b""
+            tail = b""
+        if not data:
+            if not chunk:
+                break
+            continue
+
+        # Decoding a whole chunk at once is much faster, per line only to find a bad line
+        try:
+            lines = data.decode("utf-8").split("\n")
+        except UnicodeDecodeError:
+            lines = [decode_line(raw) for raw in data.split(b"\n")]
+        lines.pop() # Empty, after the last "\n"
+
+        for line in lines:
+            lineno += 1
+            if line is None:
+                stats.errors += 1
+                on_error(lineno, "not valid UTF-8, question block skipped")
+                broken = True
+                continue
+            line = line.strip()
+            if line:
+                block.append((lineno, line))
+            elif block or broken:
+                yield from block_questions(block, broken, lineno, on_error, stats)
+                block = []
+                broken = False
+        if not chunk:
+            break
+
+    stats.lines += lineno
+    if block or broken:
+        yield from block_questions(block, broken, lineno + 1, on_error, stats)
+
+
+def decode_line(raw: bytes):
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+# The questions of one block. Normally a block is one question, files that don't separate
+# them with blank lines are one block of many. A question that goes wrong is reported at the
+# line where it does and parsing picks up again at the next question:
+#   - an answer line among the choices: the question is short, the next line starts a new one
+#   - no answer line as the 5th line: the question has extra lines, everything up to and
+#     including the next answer line is skipped
+def block_questions(block: list, broken: bool, end: int, on_error, stats: ParseStats):
+    if broken:
+        return
+    questions = [] # (tag line or None, the 5 lines)
+    i = 0
+    n = len(block)
+    while i < n:
+        tag = None
+        if is_tag(block[i][1]):
+            tag = block[i]
+            i += 1
+            if i < n and is_tag(block[i][1]):
+                stats.errors += 1
+                on_error(block[i][0], "second tag line for the same question, the first one is ignored")
+                continue
+        lines = block[i:i + 5]
+        if len(lines) < 5:
+            if lines or tag is not None:
+                stats.errors += 1
+                first = lines[0][0] if lines else tag[0]
+                on_error(first, f"question ends at line {end - 1} after {len(lines)} of 5 lines (question, 3 choices, answer)")
+            break
+        if is_answer(lines[4][1]):
+            questions.append((tag, lines))
+            i += 5
+            continue
+
+        stats.errors += 1
+        short = next((k for k in (1, 2, 3) if is_answer(lines[k][1])), None)
+        if short is not None:
+            on_error(lines[short][0], f"question at line {lines[0][0]} has {short - 1} of 3 choices")
+            i += short + 1
+        else:
+            on_error(lines[4][0], f"expected the answer (A, B or C) of the question at line {lines[0][0]}, got '{lines[4][1]}'")
+            i += 5
+            while i < n and not is_answer(block[i][1]):
+                i += 1
+            i += 1
+
+    for tag, lines in questions:
+        lineno, answer = lines[4]
+        answer = answer.split()[-1].upper()
+        if answer not in ("A", "B", "C"):
+            stats.errors += 1
+            on_error(lineno, f"answer must be A, B or C, got '{answer}'")
+            continue
+        category, difficulty = "", 0
+        if tag is not None:
+            try:
+                category, difficulty = parse_tag(tag[1])
+            except ValueError as e:
+                stats.errors += 1
+                on_error(tag[0], str(e))
+                continue
+        stats.questions += 1
+        yield lines[0][1], lines[1][1], lines[2][1], lines[3][1], answer, category, difficulty
+
+
+# An answer line ends in a single letter: "B", "Answer: B". Letters other than A, B and C
+# still count, they are reported as a bad answer rather than as a misplaced line.
+def is_answer(line: str) -> bool:
+    last = line.split()[-1]
+    return len(last) == 1 and last.isalpha()
+
+
+def is_tag(line: str) -> bool:
+    return line.startswith("[") and line.endswith("]") and "=" in line
+
+
+# "[category=Science, difficulty=2]" -> ("Science", 2)
+def parse_tag(line: str):
+    category, difficulty = "", 0
+    for item in line[1:-1].split(","):
+        key, _, value = item.partition("=")
+        key = key.strip().lower()
+        value = value.strip()
+        if key == "category":
+            category = value
+        elif key == "difficulty":
+            if not value.isdigit() or int(value) > 1000:
+                raise ValueError(f"difficulty must be a whole number, got '{value}'")
+            difficulty = int(value)
+        else:
+            raise ValueError(f"unknown tag '{key}', use category and difficulty")
+    return category, difficulty
+
+
+# Parses a question file straight into the cache format, written to out (a binary file).
+# Returns ParseStats. Records are written as they are parsed; only the offsets table and the
+# group ids (12 bytes per question) are kept in memory and written after them.
+def compile_bank(filename: str, out, on_error=None) -> ParseStats:
+    stats = ParseStats()
+    digest = hashlib.blake2b(digest_size=16)
+    offsets = array.array("Q")
+    groups = {} # (category, difficulty) -> array of question ids
+    start = time.perf_counter()
+    st = os.stat(filename)
+
+    out.write(b"\0" * HEADER.size) # Filled in at the end
+    pos = HEADER.size
+    pending = [] # Record pieces, written in batches
+    with open(filename, "rb") as f:
+        for question in parse_questions(f, on_error, stats, digest):
+            key = question[5:]
+            ids = groups.get(key)
+            if ids is None:
+                ids = groups[key] = array.array("I")
+            ids.append(len(offsets))
+            offsets.append(pos)
+            pending.append(LENGTH.pack(question[6]))
+            pos += LENGTH.size
+            for field in question[:6]:
+                data = field.encode()
+                pending.append(LENGTH.pack(len(data)))
+                pending.append(data)
+                pos += LENGTH.size + len(data)
+            if len(pending) >= 40000:
+                out.write(b"".join(pending))
+                pending = []
+    out.write(b"".join(pending))
+
+    count = len(offsets)
+    if sys.byteorder == "little":
+        offsets.byteswap()
+    out.write(offsets.tobytes())
+
+    groups_at = pos + count * OFFSET.size
+    table = [LENGTH.pack(len(groups))]
+    ids_at = groups_at + LENGTH.size + sum(GROUP.size + len(category.encode()) for (category, _) in groups)
+    for (category, difficulty), ids in groups.items():
+        name = category.encode()
+        table.append(GROUP.pack(difficulty, len(ids), ids_at, len(name)) + name)
+        ids_at += len(ids) * LENGTH.size
+    out.write(b"".join(table))
+    for ids in groups.values():
+        if sys.byteorder == "little":
+            ids.byteswap()
+        out.write(ids.tobytes())
+
+    out.seek(0)
+    out.write(HEADER.pack(MAGIC, VERSION, count, st.st_size, st.st_mtime_ns, digest.digest(), pos, groups_at))
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def file_digest(filename: str) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+# Returns (bank, stats): stats is the ParseStats of compiling the file, None when the cache
+# was used. Raises OSError when the source can't be read and ValueError when it holds no
+# complete question. Malformed entries go to on_error(line number, message).
+def open_bank(filename: str, on_error=None, cache_path=None):
+    cache_path = cache_path or filename + CACHE_SUFFIX
+    st = os.stat(filename)
+
+    cached = map_cache(cache_path, filename)
+    if cached is not None:
+        _, _, _, size, mtime_ns, digest, _, _ = HEADER.unpack_from(cached.data, 0)
+        if size == st.st_size and (mtime_ns == st.st_mtime_ns or digest == file_digest(filename)):
+            return cached, None
+        cached.close()
+
+    # Written under a temporary name and swapped in, a reader never sees half a file. The name
+    # is per process: workers of --workers compile the same file at once (at startup, on SIGHUP).
+    tmp_path = cache_path + "." + str(os.getpid()) + ".tmp"
+    try:
+        out = open(tmp_path, "w+b")
+    except OSError: # Read-only directory, serve it from memory this time
+        out = io.BytesIO()
+        tmp_path = None
+    try:
+        with out:
+            stats = compile_bank(filename, out, on_error)
+            data = out.getvalue() if tmp_path is None else None
+        if stats.questions == 0:
+            raise ValueError("File read OK but no complete questions were parsed.")
+    except BaseException:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+        raise
+    if tmp_path is None:
+        return QuestionBank(data, filename), stats
+
+    try:
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # The old cache can't be replaced (on Windows while the previous bank still maps it).
+        # Another process's cache is used only if it was compiled from the same source as
+        # this one, otherwise this compile is served from memory.
+        with open(tmp_path, "rb") as f:
+            data = f.read()
+        os.remove(tmp_path)
+        bank = map_cache(cache_path, filename)
+        if bank is not None and same_source(bank.data, data):
+            return bank, stats
+        if bank is not None:
+            bank.close()
+        return QuestionBank(data, filename), stats
+    bank = map_cache(cache_path, filename)
+    if bank is None:
+        raise BankError("Question bank cache '" + cache_path + "' could not be read back.")
+    return bank, stats
+
+
+# Whether two caches were compiled from the same source (size, mtime and digest)
+def same_source(a, b) -> bool:
+    return HEADER.unpack_from(a, 0)[3:6] == HEADER.unpack_from(b, 0)[3:6]
+
+
+# Maps an existing cache file, None if there is none or it is not valid
+def map_cache(cache_path: str, source: str = ""):
+    try:
+        with open(cache_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError): # Missing, unreadable or empty
+        return None
+    try:
+        return QuestionBank(mapped, source or cache_path, mapped)
+    except (BankError, struct.error):
+        mapped.close()
+        return None
@@ -0,0 +1,628 @@
+# ENGINE
+
+# Headless quiz server built on asyncio. One event loop handles accepting, every client
+# connection and the game itself, so there is no thread per client. The Tk window in
+# server_side.py is only a front end for this class, it can also run on its own:
+#   python quiz_engine.py --port 5000 --questions sample_questions.txt --num-questions 5 --auto-start 2
+# The engine accepts connections and does the handshake, the games themselves run in rooms
+# (quiz_room.py), any number of them side by side on the same loop.
+
+import asyncio
+import argparse
+import collections
+import os
+import signal
+import socket
+import sys
+import time
+
+from framing import FrameBuffer, FrameTooLong, RECV_SIZE
+from log_sink import LogSink, RotatingLogFile
+from metrics import Metrics
+from protocol import CODECS, ProtocolError, parse_handshake
+from question_bank import open_bank
+from quiz_room import Room
+
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+
+DEFAULT_ROOM = "main"
+MAX_ROOM_NAME = 64
+MAX_PLAYER_NAME = 64
+MAX_REPORTED_ERRORS = 20 # Malformed question entries logged one by one per load
+CLOSE_FLUSH_TIMEOUT = 10.0 # Seconds a closed client gets to take its queued messages
+
+# One connected player, wraps the asyncio stream pair, its codec (text or binary, see
+# protocol.py) with the receive decoder, and its send queue.
+# Messages are queued as already encoded bytes and a writer task per client flushes the whole
+# queue with one writelines call, so broadcasting never waits on a socket and several
+# messages sent in a row (YOURRESULT, SCORE, QUESTION) go out together.
+class ClientConnection:
+    def __init__(self, name: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, codec, rest: bytes,
+                 max_queued: int = 256, metrics=None):
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.codec = codec
+        self.decoder = codec.decoder()
+        self.decoder.feed(rest) # Bytes that arrived together with the name
+        self.sent_questions = {} # Question id -> question, binary clients get a QREF for these
+        self.room = None # The Room this client plays in, set once it is accepted
+        self.lobby = False # Stays connected between games (handshake option "lobby")
+        self.ready = False # Plays in the room's next game, see Room.set_ready
+
+        self.max_queued = max_queued # Messages waiting to be written before the client counts as too slow
+        self.outbox = collections.deque()
+        self.outbox_ready = asyncio.Event()
+        self.closing = False
+        self.metrics = metrics # Engine's Metrics, None when they are off
+        self.loop = asyncio.get_running_loop()
+        self.writer_task = self.loop.create_task(self.write_loop())
+
+    # Queues encoded bytes, returns False if the queue is full (client is not reading)
+    def send_bytes(self, data: bytes) -> bool:
+        if self.closing:
+            return True
+        if len(self.outbox) >= self.max_queued:
+            return False
+        self.outbox.append(data)
+        self.outbox_ready.set()
+        return True
+
+    def send(self, mtype: str, *fields) -> bool:
+        return self.send_bytes(self.codec.encode(mtype, *fields))
+
+    # Writer task: flushes everything queued so far, then waits for the socket to drain
+    async def write_loop(self):
+        try:
+            while True:
+                await self.outbox_ready.wait()
+                self.outbox_ready.clear()
+                if self.outbox:
+                    batch = list(self.outbox)
+                    self.outbox.clear()
+                    self.writer.writelines(batch)
+                    if self.metrics is not None:
+                        self.metrics.inc("messages_out", len(batch))
+                        self.metrics.inc("bytes_out", sum(map(len, batch)))
+                        self.metrics.observe("send_queue_depth", len(batch)) # Messages queued when the writer ran
+                    await self.writer.drain()
+                if self.closing and not self.outbox:
+                    break
+        except (ConnectionError, OSError, RuntimeError):
+            pass
+        finally:
+            try:
+                self.writer.close()
+            except (ConnectionError, OSError, RuntimeError):
+                pass
+
+    # Closes after the queued messages are written, or right away when discard is set. A peer
+    # that stopped reading would hold the flush (and the connection) forever, so the flush
+    # gets CLOSE_FLUSH_TIMEOUT seconds before the connection is aborted.
+    def close(self, discard: bool = False):
+        if discard:
+            self.outbox.clear()
+            self.writer.transport.abort()
+        elif not self.closing:
+            self.loop.call_later(CLOSE_FLUSH_TIMEOUT, self.abort_unflushed)
+        self.closing = True
+        self.outbox_ready.set()
+
+    def abort_unflushed(self):
+        if not self.writer_task.done():
+            self.outbox.clear()
+            self.writer.transport.abort()
+
+
+class QuizEngine:
+    def __init__(self, log=print):
+        self.log = log # Front ends replace this, headless mode prints
+
+        self.server = None
+        self.loop = None
+        self.is_listening = False
+        self.backlog = 1024 # Listen backlog, large rooms connect in bursts
+
+        # Every connection gets its own handshake task, so a client that never sends its name
+        # can't block anyone else. These bound how long and how many such clients we tolerate.
+        self.handshake_timeout = 5.0 # Seconds a new connection has to send its name
+        self.max_pending_handshakes = 512
+        self.pending_handshakes = 0
+        self.max_send_queue = 256 # Queued messages per client before it is disconnected as too slow
+
+        # Each room is a separate game (see quiz_room.py). Clients name their room in the
+        # handshake, older clients that don't land in DEFAULT_ROOM, which is also the room the
+        # Tk window controls. Other rooms are created when their first player arrives and
+        # dropped when their last player leaves.
+        self.rooms = {}
+        self.max_rooms = 1000
+
+        # Question banks (question_bank.py) are immutable snapshots, a reload installs a new
+        # one with the next version number. question_files maps None (the shared file) and
+        # room names to (file name, (size, mtime) when loaded) for --watch and SIGHUP.
+        self.bank_version = 0
+        self.question_files = {}
+        self.reload_lock = None
+        self.watch_interval = 0 # Seconds between checks of the question files, 0: don't watch
+        self.watch_task = None
+
+        # Defaults every new room starts with
+        self.questions = [] # Shared question file, used by rooms without one of their own
+        self.num_questions_to_ask = 0
+        self.answer_time_limit = None
+        self.auto_start = 0 # Headless mode: start a game once this many players are in a room
+        self.categories = None # Question filters and draw seed, see Room
+        self.min_difficulty = None
+        self.max_difficulty = None
+        self.seed = None
+
+        # "full": every SCORE/GAMEOVER carries the whole scoreboard.
+        # "top": they carry only the top_k players, and each player also gets a small MYRANK
+        # message with their own rank and neighbours, so traffic grows linearly with the room.
+        self.scoreboard_mode = "full"
+        self.top_k = 10
+
+        # Metrics (metrics.py), None unless enable_metrics was called. Served on 127.0.0.1 at
+        # metrics_port and/or written to metrics_dump every metrics_interval seconds.
+        self.metrics = None
+        self.metrics_port = 0
+        self.metrics_dump = ""
+        self.metrics_interval = 10.0
+
+    # Starts accepting connections on the given port
+    async def start(self, port: int, host: str = ""):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle_connection, host or None, port, backlog=self.backlog)
+        self.is_listening = True
+        self.log("<SERVER>: Listening on port " + str(port) + ". Waiting for clients...")
+        self.start_watch()
+        await self.start_metrics()
+
+    # Starts --watch, workers of --workers mode call this themselves (they never call start)
+    def start_watch(self):
+        if self.watch_interval and self.watch_task is None:
+            self.watch_task = self.loop.create_task(self.watch_questions())
+
+    # Stops listening, ends every game and kicks every player
+    async def stop(self):
+        if not self.is_listening:
+            return
+        self.log("<SERVER>: Stopping listening. Disconnecting all clients.")
+        self.is_listening = False
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            self.watch_task = None
+
+        for room in list(self.rooms.values()):
+            room.force_end_game()
+            for name in list(room.players.keys()) + list(room.waiting):
+                room.remove_client_by_name(name, reason="Server stopped listening")
+
+        if self.server is not None: # Workers of --workers mode get their connections handed over
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.metrics is not None:
+            await self.metrics.stop()
+        self.log("<SERVER>: Stopped.")
+
+    # Turns metrics on, call before start
+    def enable_metrics(self):
+        metrics = self.metrics = Metrics()
+        clients = lambda: (c for room in self.rooms.values() for c in room.players.values())
+        metrics.gauge("connected_clients", lambda: sum(len(room.players) + len(room.waiting) for room in self.rooms.values()))
+        metrics.gauge("waiting_clients", lambda: sum(len(room.waiting) for room in self.rooms.values()))
+        metrics.gauge("rooms", lambda: len(self.rooms))
+        metrics.gauge("games_active", lambda: sum(room.game_active for room in self.rooms.values()))
+        metrics.gauge("pending_handshakes", lambda: self.pending_handshakes)
+        metrics.gauge("send_queue_messages", lambda: sum(len(c.outbox) for c in clients()))
+        metrics.gauge("send_queue_max", lambda: max((len(c.outbox) for c in clients()), default=0))
+        metrics.gauge("question_bank_version", lambda: self.bank_version)
+
+    async def start_metrics(self):
+        if self.metrics is None or self.metrics.tasks:
+            return
+        await self.metrics.start(self.metrics_port, self.metrics_dump, self.metrics_interval)
+        if self.metrics_port:
+            self.log("<SERVER>: Metrics on http://127.0.0.1:" + str(self.metrics_port) + "/metrics")
+
+    # Returns the room with this name, creating it if needed. Raises ValueError with a user
+    # facing message for bad names or when the room limit is reached.
+    def get_room(self, name: str) -> Room:
+        room = self.rooms.get(name)
+        if room is not None:
+            return room
+        if len(name) > MAX_ROOM_NAME or "|" in name:
+            raise ValueError("Invalid room name.")
+        if len(self.rooms) >= self.max_rooms:
+            raise ValueError("Too many rooms open. Try later.")
+
+        room = Room(self, name, "" if name == DEFAULT_ROOM else "[" + name + "] ")
+        room.persistent = name == DEFAULT_ROOM
+        self.rooms[name] = room
+        if name != DEFAULT_ROOM:
+            self.log("ROOM: '" + name + "' opened (" + str(len(self.rooms)) + " rooms).")
+        return room
+
+    # Called by a room when its last player left and no game is running
+    def close_room_if_idle(self, room: Room):
+        if room.persistent or room.players or room.waiting or room.game_active:
+            return
+        if self.rooms.get(room.name) is room:
+            del self.rooms[room.name]
+            self.log("ROOM: '" + room.name + "' closed (" + str(len(self.rooms)) + " rooms).")
+
+    # Runs once per incoming connection: name handshake, then the receive loop of that client
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.inc("connections")
+            started = time.monotonic_ns()
+        handshake = await self.handshake(reader, writer)
+        if metrics is not None:
+            if handshake is None:
+                metrics.inc("handshakes_failed")
+            else:
+                metrics.observe("handshake_time_us", (time.monotonic_ns() - started) // 1000)
+        if handshake is not None:
+            await self.admit(reader, writer, *handshake)
+
+    # Waits for the handshake line, returns (line, bytes received after it) or None after
+    # closing the connection
+    async def handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client_addr = writer.get_extra_info("peername")
+
+        if self.pending_handshakes >= self.max_pending_handshakes:
+            self.log("CONNECT REJECT: " + str(client_addr) + " (too many pending handshakes).")
+            writer.write(b"ERROR|Server busy. Try later.\n")
+            writer.close()
+            return None
+
+        frames = FrameBuffer()
+        self.pending_handshakes += 1
+        try:
+            # Client sends name immediately as its first line, otherwise closes the connection
+            line = await asyncio.wait_for(self.read_name(reader, frames), self.handshake_timeout)
+        except asyncio.TimeoutError:
+            self.log("CONNECT REJECT: " + str(client_addr) + " (no name within " + str(self.handshake_timeout) + " seconds).")
+            line = ""
+        except (ConnectionError, OSError, UnicodeDecodeError, FrameTooLong):
+            line = ""
+        finally:
+            self.pending_handshakes -= 1
+        if not line or not self.is_listening:
+            writer.close()
+            return None
+        return line, frames.take_rest()
+
+    # Puts a connection that completed its handshake in its room and runs its receive loop
+    async def admit(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, line: str, rest: bytes):
+        client_addr = writer.get_extra_info("peername")
+        name, codec_name, room_name, lobby = parse_handshake(line)
+        if not name:
+            writer.close()
+            return
+
+        client = ClientConnection(name, reader, writer, CODECS[codec_name], rest, self.max_send_queue, self.metrics)
+        client.lobby = lobby
+
+        # Names go into MSG, SCORE and MYRANK messages of every player in the room
+        if len(name) > MAX_PLAYER_NAME:
+            self.log("CONNECT REJECT: " + name[:MAX_PLAYER_NAME] + "... from " + str(client_addr) + " (name too long).")
+            client.send("ERROR", "Name too long (at most " + str(MAX_PLAYER_NAME) + " characters).")
+            client.close()
+            return
+
+        try:
+            room = self.get_room(room_name or DEFAULT_ROOM)
+        except ValueError as e:
+            self.log("CONNECT REJECT: " + name + " from " + str(client_addr) + " (room '" + room_name + "': " + str(e) + ")")
+            client.send("ERROR", str(e))
+            client.close()
+            return
+
+        # Reject if game is active, lobby clients wait for the next one instead
+        if room.game_active and not lobby:
+            room.log("CONNECT REJECT: " + name + " from " + str(client_addr) + " (game already active).")
+            client.send("ERROR", "Game already started. Try later.") # Keep ERROR for client logic
+            client.close()
+            return
+
+        # Reject duplicate names
+        if name in room.players or name in room.waiting:
+            room.log("CONNECT REJECT: name " + name + " already connected. From " + str(client_addr) + ".")
+            client.send("ERROR", "Name already in use. Choose another.") # Keep ERROR for client logic
+            client.close()
+            return
+
+        # Accept
+        client.room = room
+        if self.metrics is not None:
+            self.metrics.inc("joins")
+        room.log("CONNECT OK: " + str(client_addr[0]) + ":" + str(client_addr[1]) + " as " + name + " (" + codec_name + " protocol"
+                 + (", lobby" if lobby else "") + ")")
+        room.add_client(client)
+
+        await self.client_loop(client)
+
+    # Reads until the first complete line, the handshake (see protocol.parse_handshake)
+    async def read_name(self, reader: asyncio.StreamReader, frames: FrameBuffer) -> str:
+        while True:
+            frame = frames.next_frame()
+            if frame is not None:
+                return frame.decode().strip()
+            data = await reader.read(RECV_SIZE)
+            if not data:
+                return ""
+            frames.feed(data)
+
+    # Receive loop of a single client, messages go to its room
+    async def client_loop(self, client: ClientConnection):
+        name = client.name
+        room = client.room
+        metrics = self.metrics
+        reason = "Client closed connection (recv empty)."
+        received_ns = time.monotonic_ns() # When the bytes being decoded arrived, the receive time of their ANSWERs
+        while self.is_listening:
+            try:
+                for parts in client.decoder.messages():
+                    room.handle_message(name, parts, received_ns)
+                    if metrics is not None:
+                        metrics.inc("messages_in")
+                data = await client.reader.read(RECV_SIZE)
+                received_ns = time.monotonic_ns()
+                if metrics is not None:
+                    metrics.inc("bytes_in", len(data))
+            except (ConnectionError, OSError):
+                reason = "Socket error / reset."
+                break
+            except FrameTooLong:
+                reason = "Message too long."
+                break
+            except ProtocolError as e:
+                reason = "Protocol error: " + str(e)
+                break
+            if not data:
+                break
+            client.decoder.feed(data)
+
+        # Only remove if the name still belongs to this connection (it may have been kicked and reused)
+        if room.players.get(name) is client or room.waiting.get(name) is client:
+            room.remove_client_by_name(name, reason=reason)
+
+    # Loads a question file, returns the number of questions loaded. Without a room the
+    # questions are the shared ones, with a room name they are that room's own (kept open).
+    # The file is compiled to a memory-mapped cache (question_bank.py), reloading an
+    # unchanged file only opens the cache. Malformed entries are logged with their line
+    # number and skipped. This blocks the caller while a changed file compiles, use
+    # reload_questions once games are running.
+    def load_questions(self, filename: str, room=None) -> int:
+        target = self.question_target(room)
+        bank, stats = self.read_bank(filename, target)
+        return self.install_bank(target, room, filename, bank, stats)
+
+    # Same as load_questions without pausing the event loop: the file is compiled in a worker
+    # thread, then the new bank replaces the old one in a single assignment on the loop. A
+    # bank is never modified once loaded, games that are running keep asking questions from
+    # the version they started with. On failure the previous version stays loaded.
+    async def reload_questions(self, filename: str, room=None) -> int:
+        target = self.question_target(room)
+        if self.reload_lock is None:
+            self.reload_lock = asyncio.Lock()
+        async with self.reload_lock: # Two compiles of one file would share its temporary file
+            bank, stats = await asyncio.get_running_loop().run_in_executor(None, self.read_bank, filename, target)
+        return self.install_bank(target, room, filename, bank, stats)
+
+    # Reloads every loaded question file, changed or not (SIGHUP in headless mode)
+    async def reload_all_questions(self):
+        for room, (filename, _) in list(self.question_files.items()):
+            try:
+                await self.reload_questions(filename, room)
+            except (OSError, ValueError):
+                pass # Already logged, the previous version stays
+
+    def question_target(self, room):
+        if room is None:
+            return self
+        target = self.get_room(room or DEFAULT_ROOM)
+        target.persistent = True
+        return target
+
+    # Compiles or opens the bank of a file, logging problems to the target's log
+    def read_bank(self, filename: str, target):
+        def malformed(lineno: int, msg: str):
+            reported.append(lineno)
+            if len(reported) <= MAX_REPORTED_ERRORS:
+                target.log("FILE WARNING: '" + filename + "' line " + str(lineno) + ": " + msg)
+        reported = []
+
+        keep = "" if not target.questions else " Keeping version " + str(target.questions.version) + "."
+        try:
+            bank, stats = open_bank(filename, on_error=malformed)
+        except ValueError as e: # No complete questions
+            target.log("FILE ERROR: '" + filename + "': " + str(e) + keep)
+            raise
+        except Exception as e:
+            target.log("FILE ERROR: Could not open/read '" + filename + "'. Exception: " + str(e) + keep)
+            raise
+
+        if len(reported) > MAX_REPORTED_ERRORS:
+            target.log("FILE WARNING: ... and " + str(len(reported) - MAX_REPORTED_ERRORS) + " more malformed entries.")
+        return bank, stats
+
+    # Makes a bank the current version for its target
+    def install_bank(self, target, room, filename: str, bank, stats) -> int:
+        self.bank_version += 1
+        bank.version = self.bank_version
+        target.questions = bank
+        self.question_files[room] = (filename, file_signature(filename))
+        how = "cached" if stats is None else "compiled: " + stats.summary()
+        target.log("FILE OK: Loaded " + str(len(bank)) + " complete questions from '" + filename + "' as version "
+                   + str(bank.version) + " (" + how + ").")
+        return len(bank)
+
+    # Reloads question files that changed on disk. A change is only picked up once the file
+    # stayed the same for one interval, so a file that is still being written isn't loaded.
+    async def watch_questions(self):
+        seen = {}
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            for room, (filename, loaded) in list(self.question_files.items()):
+                current = file_signature(filename)
+                if current is None or current == loaded:
+                    seen.pop(room, None)
+                elif seen.get(room) != current:
+                    seen[room] = current # Changed, wait one more interval
+                else:
+                    seen.pop(room, None)
+                    self.log("FILE: '" + filename + "' changed on disk, reloading.")
+                    try:
+                        await self.reload_questions(filename, room)
+                    except (OSError, ValueError):
+                        self.question_files[room] = (filename, current) # Don't retry until it changes again
+
+    # Starts the game of a room, raises ValueError with a user facing message if it can't
+    def start_game(self, num_questions: int, time_limit=None, room: str = DEFAULT_ROOM):
+        self.get_room(room).start_game(num_questions, time_limit)
+
+    # Ends the game of a room and kicks its players
+    def force_end_game(self, room: str = DEFAULT_ROOM):
+        if room in self.rooms:
+            self.rooms[room].force_end_game()
+
+
+# (size, mtime) of a file, None if it can't be read
+def file_signature(filename: str):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+# Raises the open file limit as far as allowed, every client socket is a file descriptor
+def raise_fd_limit():
+    if resource is None:
+        return
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or hard > soft:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+
+
+async def run_headless(args, log_sink: LogSink):
+    log = log_sink.log
+    if args.worker_id is not None:
+        log = lambda msg: log_sink.log("[w" + str(args.worker_id) + "] " + msg)
+
+    if args.workers > 1: # Supervisor, the workers are this same script (see supervisor.py)
+        from supervisor import Supervisor
+        worker_argv = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:]
+        engine = Supervisor(worker_argv, args.workers, log=log, log_file=args.log_file)
+    else:
+        engine = QuizEngine(log=log)
+    engine.auto_start = args.auto_start
+    engine.num_questions_to_ask = args.num_questions
+    engine.answer_time_limit = args.time_limit
+    engine.backlog = args.backlog
+    engine.handshake_timeout = args.handshake_timeout
+    engine.max_pending_handshakes = args.max_pending_handshakes
+    engine.max_send_queue = args.max_send_queue
+    engine.scoreboard_mode = args.scoreboard
+    engine.top_k = args.top_k
+    engine.categories = args.category or None
+    engine.min_difficulty = args.min_difficulty
+    engine.max_difficulty = args.max_difficulty
+    engine.seed = args.seed
+    if args.workers <= 1: # The supervisor has no question files to watch, its workers do
+        engine.watch_interval = args.watch
+    if args.metrics_port or args.metrics_dump:
+        engine.metrics_port = args.metrics_port
+        engine.metrics_dump = args.metrics_dump
+        engine.metrics_interval = args.metrics_interval
+        if args.worker_id is not None: # Next to the supervisor's: port + 1 + id, FILE.wN
+            engine.metrics_port = args.metrics_port and args.metrics_port + 1 + args.worker_id
+            engine.metrics_dump = args.metrics_dump and args.metrics_dump + ".w" + str(args.worker_id)
+        engine.enable_metrics()
+    if args.workers <= 1: # The supervisor has no rooms, its workers load the questions
+        engine.load_questions(args.questions)
+        for spec in args.room:
+            room_name, _, filename = spec.partition("=")
+            engine.load_questions(filename, room=room_name)
+
+    if hasattr(signal, "SIGHUP"): # kill -HUP reloads the question files
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(engine.reload_all_questions()))
+
+    try:
+        if args.control_fd is not None:
+            from supervisor import serve_worker
+            await serve_worker(engine, socket.socket(fileno=args.control_fd))
+        else:
+            await engine.start(args.port, args.host)
+            await asyncio.Event().wait() # Serve until interrupted
+    finally:
+        await engine.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless quiz server.")
+    parser.add_argument("--host", default="", help="Interface to bind (default: all)")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--questions", required=True, help="Question file to load")
+    parser.add_argument("--room", action="append", default=[], metavar="NAME=FILE",
+                        help="Give a room its own question file (repeatable), other rooms use --questions")
+    parser.add_argument("--watch", type=float, default=0, metavar="SECONDS",
+                        help="Check the question files this often and reload them when they change")
+    parser.add_argument("--num-questions", type=int, default=5, help="Questions per game")
+    parser.add_argument("--category", action="append", default=[], help="Only ask questions of this category (repeatable)")
+    parser.add_argument("--min-difficulty", type=int, default=None, help="Only ask questions at least this difficult")
+    parser.add_argument("--max-difficulty", type=int, default=None, help="Only ask questions at most this difficult")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the question draw, the same seed asks the same questions")
+    parser.add_argument("--time-limit", type=float, default=None, help="Answer time limit in seconds")
+    parser.add_argument("--auto-start", type=int, default=2, help="Start a game once this many players are in a room")
+    parser.add_argument("--scoreboard", choices=["full", "top"], default="full",
+                        help="full: send the whole board; top: send the top K plus a personal rank message")
+    parser.add_argument("--top-k", type=int, default=10, help="Players shown in --scoreboard top")
+    parser.add_argument("--log-file", default=None, help="Append the activity log to this file instead of stdout")
+    parser.add_argument("--log-max-bytes", type=int, default=50 * 1024 * 1024, help="Rotate the log file at this size")
+    parser.add_argument("--log-backups", type=int, default=5, help="Rotated log files to keep")
+    parser.add_argument("--backlog", type=int, default=1024, help="Listen backlog")
+    parser.add_argument("--handshake-timeout", type=float, default=5.0, help="Seconds a new connection has to send its name")
+    parser.add_argument("--max-pending-handshakes", type=int, default=512, help="Connections allowed to be waiting for a name at once")
+    parser.add_argument("--max-send-queue", type=int, default=256, help="Queued messages per client before it is dropped as too slow")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Serve metrics at http://127.0.0.1:PORT/metrics (workers use PORT+1+id)")
+    parser.add_argument("--metrics-dump", default="", metavar="FILE", help="Write a JSON metrics snapshot to FILE periodically")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="Seconds between --metrics-dump writes")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; above 1, rooms are spread over them by a supervisor (Unix only)")
+    parser.add_argument("--worker-id", type=int, default=None, help=argparse.SUPPRESS) # Set by the supervisor
+    parser.add_argument("--control-fd", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    raise_fd_limit()
+
+    # Log lines are written in batches by a background thread, never on the event loop
+    if args.log_file:
+        log_stream = RotatingLogFile(args.log_file, args.log_max_bytes, args.log_backups)
+    else:
+        log_stream = sys.stdout
+    log_sink = LogSink()
+    log_sink.start_writer(log_stream)
+    try:
+        asyncio.run(run_headless(args, log_sink))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log_sink.close()
+        if log_stream is not sys.stdout:
+            log_stream.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,657 @@
+# ROOM
+
+# One game: its players, question pool, scores and round scheduler. The engine in
+# quiz_engine.py owns the sockets and the handshake, and hands every accepted client to the
+# room it asked for. All rooms share the engine's event loop, each running game is one
+# game_loop task, so a single process hosts many games at once.
+
+import asyncio
+import random
+import time
+
+from histogram import Histogram, format_us
+from leaderboard import Leaderboard
+from player_table import ANSWERS, PlayerTable
+
+MAX_LATENCY_LINES = 20 # Players with their own latency line in the end of game log, above that only the total
+MAX_GROUP_NAMES = 20 # Players named in SCORING and ANSWER RECV log lines, above that only how many (and no LOBBY line per READY)
+
+
+class Room:
+    def __init__(self, engine, name: str, prefix: str = ""):
+        self.engine = engine
+        self.name = name
+        self.prefix = prefix # Put in front of this room's log lines
+        self.persistent = False # Kept when empty (the default room and rooms with their own file)
+
+        # The connected players by id, looked up by name like a dict (used in sending messages).
+        # Also holds their answers to the current question.
+        self.players = PlayerTable()
+
+        # Lobby clients (handshake option "lobby") stay connected between games. A client is
+        # ready when it joined with no game running or sent READY since its last game: a game
+        # starts with the ready players only (auto start counts them), the others wait in
+        # waiting until it ends, together with the lobby clients that joined during it. When
+        # it ends they all go back to players, and everyone who played has to send READY again.
+        self.waiting = {} # Name -> ClientConnection, lobby clients sitting out the running game
+        self.ready_count = 0 # Ready players, counted while no game runs
+
+        self.game_active = False
+        self.disconnected_names_this_game = set() # This is needed so the players that left
+                                                  # still show up at the end scoreboard
+
+        self.questions = [] # Own question file, empty means the engine's questions
+        self.game_bank = None # The question bank version the current game draws from
+        self.game_question_pool = [] # Holds the shuffled questions for randomization
+        self.num_questions_to_ask = engine.num_questions_to_ask
+        self.question_index = 0
+        self.answer_time_limit = engine.answer_time_limit # Seconds per question, None means wait for everyone
+        self.auto_start = engine.auto_start # Start a game once this many players are in the room
+
+        # Which questions a game draws from: category names (None: any), inclusive difficulty
+        # bounds (None: no bound), and the seed of the draw (None: a new random one per game,
+        # logged so the game can be replayed)
+        self.categories = engine.categories
+        self.min_difficulty = engine.min_difficulty
+        self.max_difficulty = engine.max_difficulty
+        self.seed = engine.seed
+
+        self.scores = Leaderboard() # Name-score pairs, kept ranked as scores change
+        self.scoreboard_mode = engine.scoreboard_mode
+        self.top_k = engine.top_k
+
+        # Everything runs on the event loop thread so answer state needs no lock.
+        # round_changed is set whenever a round might be complete (answer received,
+        # player left, game ended) and the game coroutine waits on it.
+        self.round_changed = asyncio.Event()
+        self.waiting_for_answers = False
+        self.current_correct = None
+        self.first_correct = None
+
+        # Answer timing, all time.monotonic_ns(): when the current question was broadcast and
+        # the deadline for answers (None without a time limit). Each answer's latency is kept
+        # in players.latency, the bonus goes to the correct answer with the lowest one.
+        self.question_sent_ns = 0
+        self.deadline_ns = None
+        self.question_latency = Histogram() # Microseconds, answers to the current question
+        self.player_latency = {} # Name -> Histogram of the player's answers this game
+        self.game_latency = Histogram() # Every answer of this game
+
+        self.game_task = None
+
+    def log(self, msg: str):
+        self.engine.log(self.prefix + msg)
+
+    # Registers an accepted client, starts the game if auto start is reached. During a game only
+    # lobby clients get here (see QuizEngine.admit), they are queued for the next one.
+    def add_client(self, client):
+        client.ready = True
+        if self.game_active:
+            self.waiting[client.name] = client
+            self.send_to_name(client.name, "MSG", "A game is running. You are queued for the next one.")
+            self.log("LOBBY: '" + client.name + "' queued for the next game.")
+            return
+
+        self.players.add(client.name, client)
+        self.ready_count += 1
+        self.scores.set_score(client.name, 0)
+        self.broadcast("MSG", client.name + " connected to server.")
+        self.check_auto_start()
+
+    def check_auto_start(self):
+        if self.auto_start and not self.game_active and self.engine.is_listening and self.ready_count >= self.auto_start:
+            try:
+                self.start_game(self.num_questions_to_ask, self.answer_time_limit)
+            except ValueError as e:
+                self.log("GAME: Auto-start failed: " + str(e))
+
+    # Handles one decoded message ([type, field, ...]) received from a client
+    # received_ns is when its bytes were read (time.monotonic_ns())
+    def handle_message(self, name: str, parts: list, received_ns=None):
+        # This is the special formatting used when clients answer a question
+        if parts[0] == "ANSWER":
+            if len(parts) >= 2:
+                ans = parts[1].strip().upper()
+                if ans not in ["A", "B", "C"]:
+                    self.send_to_name(name, "MSG", "Invalid answer. Use A, B, or C.")
+                    self.log("ANSWER INVALID: '" + name + "' sent '" + ans + "'")
+                else:
+                    self.process_answer(name, ans, received_ns if received_ns is not None else time.monotonic_ns())
+            else:
+                self.send_to_name(name, "MSG", "Invalid answer format.")
+        elif parts[0] == "READY":
+            self.set_ready(name)
+        else:
+            self.log("RECV (ignored) from '" + name + "': " + "|".join(parts))
+
+    # READY from a lobby client: it plays in the next game
+    def set_ready(self, name: str):
+        client = self.players.get(name) or self.waiting.get(name)
+        if client is None:
+            return
+        if client.ready:
+            self.send_to_name(name, "MSG", "You are already ready.")
+            return
+        client.ready = True
+        if name in self.waiting:
+            self.send_to_name(name, "MSG", "You are queued for the next game.")
+            return
+        self.ready_count += 1
+        if len(self.players) <= MAX_GROUP_NAMES:
+            self.log("LOBBY: '" + name + "' is ready (" + str(self.ready_count) + "/" + str(len(self.players)) + ").")
+        self.send_to_name(name, "MSG", "Ready for the next game (" + str(self.ready_count) + " players ready).")
+        self.check_auto_start()
+
+    # Function used in removing a certain client from the server
+    def remove_client_by_name(self, name: str, reason: str, discard: bool = False):
+        if name in self.waiting:
+            client = self.waiting.pop(name)
+            self.log("DISCONNECT: '" + name + "' disconnected while waiting. Reason: " + reason)
+            client.close(discard)
+            return
+        if name not in self.players:
+            return
+
+        client = self.players.remove(name)
+        if client.ready and not self.game_active:
+            self.ready_count -= 1
+        self.log("DISCONNECT: '" + name + "' disconnected. Reason: " + reason)
+        client.close(discard)
+
+        self.broadcast("MSG", "'" + name + "' disconnected.")
+
+        if self.game_active:
+            self.disconnected_names_this_game.add(name)
+
+        # Wake up the game coroutine, the round might be complete without this player
+        self.round_changed.set()
+
+        if not self.players and not self.game_active:
+            self.engine.close_room_if_idle(self)
+
+    # Starts the game, raises ValueError with a user facing message if it can't
+    def start_game(self, num_questions: int, time_limit=None):
+        if not self.engine.is_listening:
+            raise ValueError("Server is not listening yet.")
+        if self.game_active:
+            raise ValueError("Game already active.")
+        if len(self.players) < 2:
+            raise ValueError("Need at least 2 connected clients to start.")
+        if self.ready_count < 2:
+            raise ValueError("Need at least 2 ready players to start.")
+        questions = self.questions or self.engine.questions
+        if not questions:
+            raise ValueError("Load the question file successfully first.")
+        if num_questions <= 0:
+            raise ValueError("Invalid number of questions: Number must be > 0.")
+
+        # Draw this game's questions, O(num_questions) whatever the size of the bank. The game
+        # loops over them if the bank (or the filter) has fewer than num_questions.
+        seed = self.seed if self.seed is not None else random.randrange(2 ** 32)
+        bank = questions
+        pool = bank.sample(num_questions, random.Random(seed), self.categories, self.min_difficulty, self.max_difficulty)
+        if not pool:
+            raise ValueError("No questions match this room's category/difficulty filter.")
+
+        self.num_questions_to_ask = num_questions
+        self.answer_time_limit = time_limit
+        self.question_index = 0
+        self.game_active = True
+        self.waiting_for_answers = False
+        self.disconnected_names_this_game = set()
+        self.player_latency = {}
+        self.game_latency = Histogram()
+
+        self.game_bank = bank # Pinned, a reload during the game doesn't change its questions
+        self.game_question_pool = pool
+
+        # Lobby clients that didn't send READY sit this game out
+        if self.ready_count < len(self.players):
+            for name, client in self.players.items():
+                if not client.ready:
+                    self.players.remove(name)
+                    self.waiting[name] = client
+                    self.send_to_name(name, "MSG", "A game started without you. Send READY to play the next one.")
+
+        self.scores.clear() # To delete previous games' scores from the memory
+        for name in list(self.players.keys()):
+            self.scores.set_score(name, 0)
+
+        self.log("GAME: Starting new game.")
+        self.log(f"GAME: Players ({len(self.players)}): {', '.join(self.players.keys())}")
+        self.log("GAME: Questions to ask: " + str(self.num_questions_to_ask) + " (loops file if needed), drawn with seed "
+                 + str(seed) + " from question bank version " + str(bank.version) + ".")
+        if self.answer_time_limit is not None:
+            self.log("GAME: Answer time limit: " + str(self.answer_time_limit) + " seconds per question.")
+
+        self.broadcast("MSG", "GAME STARTED. Initial scoreboard sent.")
+        self.send_scoreboard(final=False)
+
+        if self.engine.metrics is not None:
+            self.engine.metrics.inc("games_started")
+        self.game_task = self.engine.loop.create_task(self.game_loop())
+
+    # Function that ends the game and kicks all players if game is active
+    def force_end_game(self):
+        if not self.game_active:
+            return
+
+        self.log("GAME: Force-ending game now.")
+        self.game_active = False
+        self.waiting_for_answers = False
+        # Stop the game coroutine, a game started from the lobby right after this must not
+        # find it still running
+        if self.game_task is not None and self.game_task is not asyncio.current_task():
+            self.game_task.cancel()
+        self.game_task = None
+
+        self.send_scoreboard(final=True)
+        self.log_latency()
+
+        # Clients handle disconnection after "GAMEOVER|", so we can close the sockets here.
+        # Lobby clients stay for the next game.
+        for name, client in self.players.items():
+            if not client.lobby:
+                self.remove_client_by_name(name, reason="Game ended by server command.")
+        self.reopen_lobby()
+
+    # The game logic
+    async def game_loop(self):
+        while self.game_active and self.question_index < self.num_questions_to_ask:
+            # If fewer than 2 players at the start of a question, end immediately.
+            if len(self.players) < 2:
+                self.log("GAME: Ending because fewer than 2 players remain connected.")
+                break
+
+            q = self.game_question_pool[self.question_index % len(self.game_question_pool)] # Pick the question from the randomized pool
+
+            q_text = q.text
+            ans = q.answer
+
+            if ans not in ["A", "B", "C"]: # To make sure the question file only has a,b or c as answers
+                self.log("GAME WARNING: invalid correct answer '" + str(ans) + "'. Treating as 'A'.")
+                ans = "A"
+
+            # Setup answering state
+            self.waiting_for_answers = True
+            self.current_correct = ans
+            self.players.clear_answers()
+            self.first_correct = None
+            self.question_latency = Histogram()
+
+            # Broadcast question to all clients
+            # (QUESTION|text|A|B|C|idx|total in the text protocol, client.py works in the same format)
+            # Stamped before queueing, the time it spends in the send queues counts against the players
+            self.question_sent_ns = time.monotonic_ns()
+            self.deadline_ns = None
+            if self.answer_time_limit is not None:
+                self.deadline_ns = self.question_sent_ns + int(self.answer_time_limit * 1e9)
+            self.broadcast_question(q, self.question_index + 1, self.num_questions_to_ask)
+
+            self.log("------------------------------------------------------------")
+            self.log("QUESTION "+str(self.question_index + 1)+"/"+str(self.num_questions_to_ask)+": "+str(q_text))
+            if self.answer_time_limit is None:
+                self.log("GAME: Waiting for ALL connected players to submit an answer...")
+            else:
+                self.log("GAME: Waiting for answers (up to " + str(self.answer_time_limit) + " seconds)...")
+
+            # Sleep until the round is complete or the deadline passes, woken by round_changed
+            if not await self.wait_for_round():
+                self.log("GAME: Answer time limit reached. Scoring with the answers received.")
+
+            if not self.game_active:
+                break
+
+            metrics = self.engine.metrics
+            if metrics is None:
+                self.score_current_question()
+            else:
+                scoring_ns = time.monotonic_ns()
+                metrics.observe("round_duration_us", (scoring_ns - self.question_sent_ns) // 1000)
+                self.score_current_question()
+                metrics.observe("scoring_time_us", (time.monotonic_ns() - scoring_ns) // 1000)
+
+            self.question_index += 1
+
+            # After scoring if less than 2 players remain -> end game
+            if len(self.players) < 2:
+                self.log("GAME: Ending after scoring because fewer than 2 players remain connected.")
+                break
+
+        self.end_game_naturally()
+
+    # True when every connected player answered (or the game stopped)
+    def round_complete(self) -> bool:
+        return not self.game_active or self.players.answered >= len(self.players)
+
+    # Waits until the current round is complete, returns False on timeout
+    async def wait_for_round(self) -> bool:
+        while not self.round_complete():
+            self.round_changed.clear()
+            if self.deadline_ns is None:
+                await self.round_changed.wait()
+                continue
+            remaining = (self.deadline_ns - time.monotonic_ns()) / 1e9
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self.round_changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return self.round_complete()
+        return True
+
+    # Processes the received answer, received_ns is its arrival time (time.monotonic_ns())
+    def process_answer(self, name: str, ans: str, received_ns: int):
+        if not self.game_active:
+            self.send_to_name(name, "MSG", "No active game right now.")
+            self.log("ANSWER IGNORED: '" + name + "' answered but no active game.")
+            return
+
+        if not self.waiting_for_answers:
+            self.send_to_name(name, "MSG", "Not accepting answers at the moment.")
+            self.log("ANSWER IGNORED: '" + name + "' answered outside answering phase.")
+            return
+
+        pid = self.players.ids.get(name)
+        if pid is None: # Waiting for the next game
+            self.send_to_name(name, "MSG", "You are not playing in this game, wait for the next one.")
+            return
+        if self.players.answers[pid]:
+            self.send_to_name(name, "MSG", "You already submitted an answer for this question.")
+            self.log("ANSWER DUPLICATE: '" + name + "' tried second answer '" + ans + "'.")
+            return
+
+        # Read after the deadline, even if scoring hasn't run yet
+        if self.deadline_ns is not None and received_ns > self.deadline_ns:
+            self.send_to_name(name, "MSG", "Time is up for this question.")
+            self.log("ANSWER LATE: '" + name + "' answered '" + ans + "' "
+                     + format_us((received_ns - self.deadline_ns) // 1000) + " after the deadline.")
+            return
+
+        # Time the answer waited for the event loop after its bytes arrived (what other servers
+        # would spend waiting on an answer lock)
+        if self.engine.metrics is not None:
+            self.engine.metrics.inc("answers")
+            self.engine.metrics.observe("answer_wait_us", (time.monotonic_ns() - received_ns) // 1000)
+
+        # Every answer of a round arrives at about the same time and each one holds up the
+        # event loop while it is taken, so taking it is only appending it to the answer log.
+        # Logging and latency statistics happen once per round in log_answers.
+        self.players.set_answer(pid, ans, received_ns - self.question_sent_ns)
+
+        # Wake the game coroutine only for the answer that completes the round
+        if self.players.answered >= len(self.players):
+            self.round_changed.set()
+
+    # Logs the round's answers in arrival order and records their latencies
+    def log_answers(self):
+        players = self.players
+        names = players.names
+        answers = players.answers
+        latency = players.latency
+        # One line per answer in small rooms, above MAX_GROUP_NAMES only the count below
+        log_each = len(players.order) <= MAX_GROUP_NAMES
+        for seq, pid in enumerate(players.order):
+            name = names[pid]
+            us = latency[pid] // 1000
+            self.question_latency.record(us)
+            self.game_latency.record(us)
+            histogram = self.player_latency.get(name)
+            if histogram is None:
+                histogram = self.player_latency[name] = Histogram()
+            histogram.record(us)
+            if log_each:
+                self.log("ANSWER RECV #" + str(seq + 1) + ": '" + name + "' -> " + ANSWERS[answers[pid] - 1] + " in " + format_us(us))
+        self.log("ANSWERS: " + str(players.answered) + "/" + str(len(players)) + " players answered.")
+
+    # Function to calculate the scoring for the current question
+    def score_current_question(self):
+        correct = self.current_correct
+        players = self.players
+        names = players.names
+        clients = players.clients
+        answers = players.answers
+        latency = players.latency
+        correct_code = ANSWERS.index(correct) + 1
+        self.log_answers()
+
+        # Lowest measured latency wins the bonus, ties go to the lower sequence number
+        first_id = None
+        for pid in players.order:
+            if answers[pid] == correct_code and clients[pid] is not None:
+                if first_id is None or latency[pid] < latency[first_id]:
+                    first_id = pid
+        first = names[first_id] if first_id is not None else None
+        self.first_correct = first
+        num_players = len(players)
+        bonus = max(0, num_players - 1)
+
+        self.log(f"SCORING: Correct='{correct}'. First correct={first if first else 'None'} (bonus={bonus}).")
+
+        # A round has at most five results: no answer, correct, correct and first, and the two
+        # wrong answers. Players are grouped by answer code and each result is encoded once
+        # per codec, everything after the grouping is queueing the same bytes.
+        groups = [[], [], [], []] # Answer code -> ids of the players still here
+        for pid, code in enumerate(answers):
+            if clients[pid] is not None: # Free id, or the player left during the round
+                groups[code].append(pid)
+        correct_ids = groups[correct_code]
+        first_bonus = first_id is not None and bonus > 0 # A bonus of 0 gets the plain correct result
+        if first_bonus:
+            correct_ids.remove(first_id)
+
+        # Players missing from the scores start at 0
+        gained = dict.fromkeys([names[pid] for pid in correct_ids], 1)
+        if first_bonus:
+            gained[first] = 1 + bonus
+        self.scores.add_points_many(gained)
+
+        if first_bonus:
+            self.multicast([first_id], "YOURRESULT", "Correct AND first! '" + correct + "' is right. +1+" + str(bonus) + "=" + str(1 + bonus) + " points.")
+            self.log("SCORING: '" + first + "' correct and first. +1+" + str(bonus) + ". Total=" + str(self.scores.score(first)))
+        if correct_ids:
+            self.multicast(correct_ids, "YOURRESULT", "Correct. '" + correct + "' is right. +1 point.")
+            self.log("SCORING: correct, +1: " + self.group_names(correct_ids))
+        for code in range(1, len(groups)):
+            if code != correct_code and groups[code]:
+                client_answer = ANSWERS[code - 1]
+                self.multicast(groups[code], "YOURRESULT", f"Wrong. You answered '{client_answer}'. Correct was '{correct}'. +0 points.")
+                self.log(f"SCORING: wrong ('{client_answer}'), +0: " + self.group_names(groups[code]))
+        # Happens when the answer time limit runs out before these players answered
+        if groups[0]:
+            self.multicast(groups[0], "YOURRESULT", "You did not submit an answer. Correct was '" + correct + "'. +0 points.")
+            self.log("SCORING: no answer, +0: " + self.group_names(groups[0]))
+
+        self.log("LATENCY: question " + str(self.question_index + 1) + ": " + self.question_latency.summary(format_us))
+
+        sb = self.send_scoreboard(final=False)
+        self.log("SCOREBOARD SENT:\n" + sb)
+
+        self.waiting_for_answers = False
+
+    # If the game ends naturally, this function runs
+    def end_game_naturally(self):
+        if not self.game_active:
+            return
+
+        self.game_active = False
+        self.waiting_for_answers = False
+
+        final_sb = self.send_scoreboard(final=True)
+
+        self.log("GAME: Ended. Final scoreboard/rankings calculated.")
+        self.log("FINAL SCOREBOARD:\n" + final_sb)
+        self.log_latency()
+        self.reopen_lobby()
+
+        if not self.players:
+            self.engine.close_room_if_idle(self)
+
+    # After a game: the players have to send READY again and the waiting lobby clients join
+    # them. Other clients disconnect on GAMEOVER by themselves.
+    def reopen_lobby(self):
+        for client in self.players.values():
+            client.ready = False
+        waiting = self.waiting
+        self.waiting = {}
+        self.ready_count = 0
+        for name, client in waiting.items():
+            self.players.add(name, client)
+            self.scores.set_score(name, 0)
+            self.ready_count += client.ready
+        lobby = [pid for pid, client in enumerate(self.players.clients) if client is not None and client.lobby]
+        if lobby:
+            self.log("LOBBY: " + str(len(lobby)) + " players stay for the next game, " + str(self.ready_count) + " ready.")
+            self.multicast(lobby, "MSG", "Send READY to play the next game.")
+        self.check_auto_start()
+
+    # Answer latency of the game that just ended, in total and per player
+    def log_latency(self):
+        self.log("LATENCY: game: " + self.game_latency.summary(format_us))
+        if len(self.player_latency) > MAX_LATENCY_LINES:
+            return
+        for name in sorted(self.player_latency):
+            self.log("LATENCY: '" + name + "': " + self.player_latency[name].summary(format_us))
+
+    # Send to a spesific name
+    def send_to_name(self, name: str, mtype: str, *fields):
+        client = self.players.get(name) or self.waiting.get(name)
+        if client is None:
+            return
+        if not client.send(mtype, *fields):
+            self.drop_slow_clients([name])
+
+    # Send to all connected clients, the message is encoded once per codec and queued for everyone
+    def broadcast(self, mtype: str, *fields):
+        encoded = {}
+        slow = []
+        for name, client in self.players.items():
+            data = encoded.get(client.codec.name)
+            if data is None:
+                data = encoded[client.codec.name] = client.codec.encode(mtype, *fields)
+            if not client.send_bytes(data):
+                slow.append(name)
+        if slow:
+            self.drop_slow_clients(slow)
+
+    # Sends one message to the players with the given ids, encoded once per codec. Ids of
+    # players that left since (dropping a slow client can drop others) are skipped.
+    def multicast(self, pids, mtype: str, *fields):
+        clients = self.players.clients
+        encoded = {}
+        slow = []
+        for pid in pids:
+            client = clients[pid]
+            if client is None:
+                continue
+            data = encoded.get(client.codec.name)
+            if data is None:
+                data = encoded[client.codec.name] = client.codec.encode(mtype, *fields)
+            if not client.send_bytes(data):
+                slow.append(client.name)
+        if slow:
+            self.drop_slow_clients(slow)
+
+    # Names of a group of players for the log, only the count in big rooms
+    def group_names(self, pids) -> str:
+        if len(pids) > MAX_GROUP_NAMES:
+            return str(len(pids)) + " players"
+        names = self.players.names
+        return ", ".join("'" + names[pid] + "'" for pid in pids)
+
+    # Sends a question to everyone. Binary clients that already got this question (it repeats
+    # when the game asks more questions than the file has) only get its id.
+    def broadcast_question(self, q, idx: int, total: int):
+        qid = q.id
+        choices = q.choices
+        full = ("QUESTION", q.text, choices[0], choices[1], choices[2], idx, total)
+        encoded = {}
+        slow = []
+        for name, client in self.players.items():
+            if client.codec.name == "binary":
+                if client.sent_questions.get(qid) is q:
+                    key = "ref"
+                    msg = ("QREF", qid, idx, total)
+                else:
+                    client.sent_questions[qid] = q
+                    key = "binary"
+                    msg = full + (qid,)
+            else:
+                key = "text"
+                msg = full
+            data = encoded.get(key)
+            if data is None:
+                data = encoded[key] = client.codec.encode(*msg)
+            if not client.send_bytes(data):
+                slow.append(name)
+        if slow:
+            self.drop_slow_clients(slow)
+
+    # Disconnects clients whose send queue is full, they stopped reading
+    def drop_slow_clients(self, names):
+        if self.engine.metrics is not None:
+            self.engine.metrics.inc("slow_clients_dropped", len(names))
+        for name in names:
+            self.remove_client_by_name(name, reason="Send queue full (client not reading).", discard=True)
+
+    # Sends SCORE| (or GAMEOVER| when final) in the current scoreboard mode, returns the board text
+    def send_scoreboard(self, final: bool) -> str:
+        if self.scoreboard_mode == "top":
+            sb = self.format_scoreboard(final, limit=self.top_k)
+            # Personal ranks go first, clients disconnect when GAMEOVER arrives
+            self.send_personal_ranks()
+        else:
+            sb = self.format_scoreboard(final)
+
+        self.broadcast("GAMEOVER" if final else "SCORE", sb)
+        return sb
+
+    # MYRANK|rank|score|players|above name|above score|below name|below score
+    # (neighbour fields are empty for the first / last player)
+    def send_personal_ranks(self):
+        total = len(self.scores)
+        for name in list(self.players.keys()):
+            if name not in self.scores:
+                continue
+            above, below = self.scores.neighbours(name)
+            fields = [self.scores.rank(name), self.scores.score(name), total]
+            for entry in (above, below):
+                if entry is None:
+                    fields += ["", ""]
+                else:
+                    fields += [entry[1], entry[2]]
+            self.send_to_name(name, "MYRANK", *fields)
+
+    # Scoreboard formatting, limit keeps only the first limit players
+    def format_scoreboard(self, final: bool, limit=None):
+        lines = []
+        total = len(self.scores)
+        if limit is None or total <= limit:
+            lines.append("FINAL SCOREBOARD (with rankings):" if final else "SCOREBOARD:")
+            entries = self.scores.ranked()
+        else:
+            lines.append(("FINAL SCOREBOARD" if final else "SCOREBOARD") + f" (top {limit} of {total}):")
+            entries = self.scores.top(limit)
+
+        # Already ordered by score (descending) then by name (ascending), ties share a rank
+        for (rank, name, score) in entries:
+            lines.append(f"#{rank}) {name}: {score} points")
+        if limit is not None and total > limit:
+            lines.append(f"... and {total - limit} more players")
+
+        if final and len(self.scores) > 0:
+            top_score, winners = self.scores.leaders()
+            if len(winners) == 1:
+                lines.append(f"\nWINNER: {winners[0]} with {top_score} points!")
+            elif limit is not None and len(winners) > limit:
+                lines.append(f"\nWINNERS (tie): {len(winners)} players with {top_score} points!")
+            else:
+                lines.append(f"\nWINNERS (tie): {', '.join(winners)} with {top_score} points!")
+
+        # Also include disconnected names, but only if they were part of this game.
+        if self.disconnected_names_this_game and limit is not None and len(self.disconnected_names_this_game) > limit:
+            lines.append(f"\nDisconnected Players: {len(self.disconnected_names_this_game)}")
+        elif self.disconnected_names_this_game:
+            lines.append(f"\nDisconnected Players: {', '.join(sorted(list(self.disconnected_names_this_game)))}")
+
+        return "\n".join(lines)
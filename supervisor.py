@@ -0,0 +1,212 @@
+# SUPERVISOR
+
+# Multi-process mode (python quiz_engine.py --workers N ...). One CPython process runs all
+# game logic on a single core, so the supervisor spreads the rooms over N worker processes:
+#   - the supervisor listens and reads the handshake line of every connection (it is a
+#     QuizEngine that never has rooms of its own),
+#   - the room name picks the worker (a hash of the name), so every player of a room ends up
+#     in the same process and a game never spans two workers,
+#   - the connected socket is passed to that worker over a Unix socketpair (SCM_RIGHTS),
+#     together with the handshake line and any bytes read after it, and the worker admits it
+#     as if it had accepted it itself.
+# Workers send a small STATS datagram back every second (rooms, players). That is the lobby
+# view the supervisor logs, and a heartbeat: a worker whose supervisor is gone shuts down,
+# a worker that exits is restarted.
+# Needs socket.send_fds (Unix, Python 3.9+).
+
+import asyncio
+import signal
+import socket
+import struct
+import subprocess
+import zlib
+
+from protocol import CODECS, parse_handshake
+from quiz_engine import DEFAULT_ROOM, QuizEngine
+
+HANDOFF = struct.Struct("!I") # Length of the handshake line at the start of a handoff datagram
+STATS_INTERVAL = 1.0 # Seconds between STATS datagrams
+MAX_DATAGRAM = 256 * 1024
+
+
+# One worker process and the supervisor's end of its control socket
+class Worker:
+    def __init__(self, index: int, argv: list, log_file=None):
+        self.index = index
+        self.argv = argv
+        self.log_file = log_file
+        self.process = None
+        self.control = None
+        self.rooms = 0
+        self.players = 0
+
+    def start(self):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        argv = self.argv + ["--workers", "1", "--worker-id", str(self.index), "--control-fd", str(child.fileno())]
+        if self.log_file:
+            argv += ["--log-file", self.log_file + ".w" + str(self.index)]
+        self.process = subprocess.Popen(argv, pass_fds=[child.fileno()])
+        child.close()
+        parent.setblocking(False)
+        self.control = parent
+        self.rooms = 0
+        self.players = 0
+
+    def stop(self):
+        if self.control is not None:
+            self.control.close()
+            self.control = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+class Supervisor(QuizEngine):
+    def __init__(self, worker_argv: list, workers: int, log=print, log_file=None):
+        super().__init__(log)
+        if not hasattr(socket, "send_fds"):
+            raise ValueError("--workers needs a platform with socket.send_fds (Unix, Python 3.9+).")
+        self.workers = [Worker(i, worker_argv, log_file) for i in range(workers)]
+        self.lobby = (0, 0) # Rooms and players over all workers, as last logged
+        self.monitor_task = None
+
+    # Starts the workers, then listens
+    async def start(self, port: int, host: str = ""):
+        self.loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            self.start_worker(worker)
+        self.monitor_task = self.loop.create_task(self.monitor())
+        await super().start(port, host)
+        self.log("<SERVER>: Handing connections to " + str(len(self.workers)) + " worker processes.")
+
+    async def stop(self):
+        if self.monitor_task is not None: # First, workers exiting now must not be restarted
+            self.monitor_task.cancel()
+            self.monitor_task = None
+        await super().stop()
+        for worker in self.workers:
+            if worker.control is not None:
+                self.loop.remove_reader(worker.control.fileno())
+            worker.stop()
+        for worker in self.workers:
+            if worker.process is not None:
+                await self.loop.run_in_executor(None, worker.process.wait)
+
+    # SIGHUP: the workers hold the question banks, each reloads its own
+    async def reload_all_questions(self):
+        for worker in self.workers:
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.send_signal(signal.SIGHUP)
+
+    def start_worker(self, worker: Worker):
+        worker.start()
+        self.loop.add_reader(worker.control.fileno(), self.read_stats, worker)
+        self.log("WORKER " + str(worker.index) + ": started (pid " + str(worker.process.pid) + ").")
+
+    # Restarts workers that exited
+    async def monitor(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            for worker in self.workers:
+                code = worker.process.poll()
+                if code is None:
+                    continue
+                self.log("WORKER " + str(worker.index) + ": exited with code " + str(code) + ", restarting.")
+                self.loop.remove_reader(worker.control.fileno())
+                worker.stop()
+                self.start_worker(worker)
+
+    # STATS|rooms|players datagrams from a worker
+    def read_stats(self, worker: Worker):
+        while True:
+            try:
+                data = worker.control.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                return
+            parts = data.decode(errors="replace").split("|")
+            if len(parts) == 3 and parts[0] == "STATS" and parts[1].isdigit() and parts[2].isdigit():
+                worker.rooms = int(parts[1])
+                worker.players = int(parts[2])
+
+        lobby = (sum(w.rooms for w in self.workers), sum(w.players for w in self.workers))
+        if lobby != self.lobby:
+            self.lobby = lobby
+            per_worker = ", ".join(str(w.rooms) + "/" + str(w.players) for w in self.workers)
+            self.log("LOBBY: " + str(lobby[0]) + " rooms, " + str(lobby[1]) + " players (rooms/players per worker: " + per_worker + ")")
+
+    # Instead of joining a room here, the connection goes to the worker that owns the room.
+    # Clients send nothing after their name until the first question arrives, so no bytes are
+    # left behind in this process's stream buffer.
+    async def admit(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, line: str, rest: bytes):
+        client_addr = writer.get_extra_info("peername")
+        writer.transport.pause_reading()
+        _, codec_name, room_name, _ = parse_handshake(line)
+        room_name = room_name or DEFAULT_ROOM
+        worker = self.workers[zlib.crc32(room_name.encode()) % len(self.workers)]
+
+        data = line.encode()
+        payload = HANDOFF.pack(len(data)) + data + rest
+        try:
+            socket.send_fds(worker.control, [payload], [writer.get_extra_info("socket").fileno()])
+        except OSError as e: # Worker restarting or its queue is full
+            self.log("CONNECT REJECT: " + str(client_addr) + " (worker " + str(worker.index) + " unavailable: " + str(e) + ")")
+            writer.write(CODECS[codec_name].encode("ERROR", "Server busy. Try later.")) # In the format the client asked for
+            writer.close()
+            if self.metrics is not None:
+                self.metrics.inc("handoffs_failed")
+            return
+        writer.transport.abort() # The worker has its own copy of the socket now
+        if self.metrics is not None:
+            self.metrics.inc("handoffs")
+
+
+# Worker side: takes connections from the supervisor and reports STATS until the supervisor
+# goes away
+async def serve_worker(engine: QuizEngine, control: socket.socket):
+    engine.loop = asyncio.get_running_loop()
+    engine.is_listening = True
+    engine.start_watch()
+    await engine.start_metrics()
+    control.setblocking(False)
+    engine.loop.add_reader(control.fileno(), receive_handoffs, engine, control)
+    engine.log("<SERVER>: Worker ready, taking connections from the supervisor.")
+    try:
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            players = sum(len(room.players) + len(room.waiting) for room in engine.rooms.values())
+            try:
+                control.send(("STATS|" + str(len(engine.rooms)) + "|" + str(players)).encode())
+            except BlockingIOError:
+                pass
+    except OSError:
+        engine.log("<SERVER>: Supervisor is gone, shutting down.")
+    finally:
+        engine.loop.remove_reader(control.fileno())
+        control.close()
+
+
+def receive_handoffs(engine: QuizEngine, control: socket.socket):
+    while True:
+        try:
+            data, fds, _, _ = socket.recv_fds(control, MAX_DATAGRAM, 1)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            return
+        if not fds:
+            continue
+        sock = socket.socket(fileno=fds[0])
+        length = HANDOFF.unpack_from(data)[0]
+        line = data[HANDOFF.size:HANDOFF.size + length].decode(errors="replace")
+        rest = data[HANDOFF.size + length:]
+        engine.loop.create_task(adopt(engine, sock, line, rest))
+
+
+async def adopt(engine: QuizEngine, sock: socket.socket, line: str, rest: bytes):
+    try:
+        reader, writer = await asyncio.open_connection(sock=sock)
+    except OSError:
+        sock.close()
+        return
+    await engine.admit(reader, writer, line, rest)
@@ -0,0 +1,55 @@
+# TESTS: wire formats (protocol.py codecs)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import CODECS, MAX_SHORT_STRING
+
+
+def round_trip(codec_name: str, mtype: str, *fields) -> list:
+    codec = CODECS[codec_name]
+    decoder = codec.decoder(1 << 22)
+    decoder.feed(codec.encode(mtype, *fields))
+    return list(decoder.messages())
+
+
+def test_text_round_trip():
+    assert round_trip("text", "MSG", "two\nlines") == [["MSG", "two\\nlines"]]
+    assert round_trip("text", "MYRANK", 1, 30, 2, "", "", "bob", 20) == [["MYRANK", "1", "30", "2", "", "", "bob", "20"]]
+
+
+def test_binary_round_trip():
+    assert round_trip("binary", "MSG", "héllo") == [["MSG", "héllo"]]
+    assert round_trip("binary", "MYRANK", 2, 20, 3, "alice", 30, "", 0) == [["MYRANK", "2", "20", "3", "alice", "30", "", ""]]
+    assert round_trip("binary", "ANSWER", "B") == [["ANSWER", "B"]]
+    assert round_trip("binary", "READY") == [["READY"]]
+
+
+def test_binary_question_then_reference():
+    codec = CODECS["binary"]
+    decoder = codec.decoder()
+    decoder.feed(codec.encode("QUESTION", "Q?", "a", "b", "c", 1, 5, 42) + codec.encode("QREF", 42, 2, 5))
+    assert list(decoder.messages()) == [["QUESTION", "Q?", "a", "b", "c", "1", "5"], ["QUESTION", "Q?", "a", "b", "c", "2", "5"]]
+
+
+# "s" fields have a uint16 length, longer strings are cut instead of failing the broadcast
+def test_binary_short_string_limit():
+    fits = "x" * MAX_SHORT_STRING
+    assert round_trip("binary", "MSG", fits) == [["MSG", fits]]
+    assert round_trip("binary", "MSG", fits + "yz") == [["MSG", fits]]
+    rank = round_trip("binary", "MYRANK", 1, 10, 2, "", 0, "n" * (MAX_SHORT_STRING + 1), 5)[0]
+    assert rank[6] == "n" * MAX_SHORT_STRING and rank[7] == "5"
+
+
+def test_binary_cut_keeps_characters_whole():
+    text = "é" * MAX_SHORT_STRING # 2 bytes each
+    message = round_trip("binary", "MSG", text)[0][1]
+    assert message == "é" * (MAX_SHORT_STRING // 2)
+
+
+# "S" fields (the boards) are not limited by the short string cap
+def test_binary_long_string():
+    board = "line\n" * 20000
+    assert round_trip("binary", "SCORE", board) == [["SCORE", board]]
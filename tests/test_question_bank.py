@@ -0,0 +1,43 @@
+# TESTS: question bank cache (question_bank.open_bank)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import question_bank
+from question_bank import open_bank
+
+
+def write_questions(path, *names):
+    with open(path, "w") as f:
+        f.write("\n\n".join(name + "?\na\nb\nc\nA" for name in names) + "\n")
+
+
+def test_cache_reused_until_source_changes(tmp_path):
+    source = str(tmp_path / "q.txt")
+    write_questions(source, "Q1", "Q2")
+    bank, stats = open_bank(source)
+    assert stats is not None and [q.text for q in bank] == ["Q1?", "Q2?"]
+    bank.close()
+    bank, stats = open_bank(source)
+    assert stats is None
+    bank.close()
+
+
+# The old cache can't always be replaced (Windows, while the previous bank maps it), the new
+# compile must be served rather than the stale cache
+def test_edit_served_when_cache_cannot_be_replaced(tmp_path, monkeypatch):
+    source = str(tmp_path / "q.txt")
+    write_questions(source, "Q1")
+    old, _ = open_bank(source)
+    write_questions(source, "Q1", "Q2")
+
+    def replace(src, dst):
+        raise PermissionError("in use")
+    monkeypatch.setattr(question_bank.os, "replace", replace)
+    bank, stats = open_bank(source)
+    assert stats is not None and [q.text for q in bank] == ["Q1?", "Q2?"]
+    assert sorted(os.listdir(tmp_path)) == ["q.txt", "q.txt.qbank"] # No temporary file left behind
+    bank.close()
+    old.close()
@@ -0,0 +1,45 @@
+# TESTS: question file parsing (question_bank.parse_questions)
+
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from question_bank import parse_questions
+
+
+def parse(text: str):
+    errors = []
+    questions = list(parse_questions(io.BytesIO(text.encode()), lambda lineno, msg: errors.append((lineno, msg))))
+    return [q[0] for q in questions], errors
+
+
+def question(n: int, answer: str = "B") -> list:
+    return ["Q" + str(n) + "?", "first", "second", "third", answer]
+
+
+def test_separated_questions():
+    names, errors = parse("\n\n".join("\n".join(question(n)) for n in range(1, 4)) + "\n")
+    assert names == ["Q1?", "Q2?", "Q3?"]
+    assert errors == []
+
+
+# Without blank lines the file is one block, a bad question must not take the others with it
+def test_unseparated_file_keeps_good_questions():
+    lines = (question(1)
+             + ["Q2?", "b1", "b2", "A"]             # lines 6-9, one choice short
+             + question(3)
+             + ["Q4?", "d1", "d2", "d3", "d4", "C"]  # lines 15-20, one choice too many
+             + question(5)
+             + question(6, "D")                      # lines 26-30, bad answer
+             + question(7))
+    names, errors = parse("\n".join(lines))
+    assert names == ["Q1?", "Q3?", "Q5?", "Q7?"]
+    assert [lineno for lineno, _ in errors] == [9, 19, 30]
+
+
+def test_incomplete_last_question():
+    names, errors = parse("\n".join(question(1)) + "\n\n" + "\n".join(question(2)[:4]) + "\n")
+    assert names == ["Q1?"]
+    assert [lineno for lineno, _ in errors] == [7]